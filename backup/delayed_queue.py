@@ -0,0 +1,144 @@
+"""
+Отложенная очередь отправки: элементы лежат в Redis ZSET с временем отправки
+в качестве score, пока не наступит их время.
+
+В отличие от задач Celery с eta, отложенные элементы не попадают в воркеры:
+память воркеров не зависит от того, на сколько дней вперед запланирована
+отправка. Наступившие элементы пачками переносит в очередь задач
+периодическая задача (см. move_due_congratulations в tasks.py).
+
+Забранный элемент не удаляется сразу, а переезжает в ZSET обработки
+с дедлайном visibility_timeout: после постановки задачи в брокер его
+подтверждают (ack). Если поллер упал или брокер не принял задачу, элемент
+по истечении дедлайна возвращается в очередь - пачка не теряется.
+
+MemoryDelayedQueue - замена на куче в памяти процесса для тестов
+(DELAYED_QUEUE=memory): элементы видит только тот процесс, что их добавил.
+"""
+import heapq
+import time
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+from redis import Redis
+
+from config.config import RedisConfig
+
+
+class DelayedQueue:
+    """Отложенная очередь на Redis ZSET"""
+
+    def __init__(
+        self, redis: Redis, key: str = "newyear:delayed", visibility_timeout: float = 300.0
+    ):
+        self.redis = redis
+        self.key = key
+        self.processing_key = f"{key}:processing"
+        # Сколько секунд забранный элемент ждет подтверждения до возврата в очередь
+        self.visibility_timeout = visibility_timeout
+
+    def add_many(self, items: Iterable[Tuple[str, float]], batch_size: int = 1000) -> int:
+        """
+        Добавить элементы (member, время отправки в epoch-секундах).
+        Уже лежащий в очереди такой же member не меняется и не дублируется.
+        Повторный запуск планирования этого не гарантирует: его пачки - новые
+        member (другие минуты и состав), поэтому перед ним очередь очищают
+        """
+        added = 0
+        batch = {}
+        for member, due in items:
+            batch[member] = due
+            if len(batch) >= batch_size:
+                added += self.redis.zadd(self.key, batch, nx=True)
+                batch = {}
+        if batch:
+            added += self.redis.zadd(self.key, batch, nx=True)
+        return added
+
+    def _move(self, source: str, target: str, until: float, limit: int, score: float) -> List[str]:
+        """
+        Атомарно перенести до limit элементов со score <= until из source в target.
+        WATCH + MULTI: если source изменился между чтением и записью (другой
+        поллер), транзакция повторяется, поэтому элемент достается одному поллеру
+        """
+        def move(pipe) -> List[str]:
+            members = pipe.zrangebyscore(source, "-inf", until, start=0, num=limit)
+            pipe.multi()
+            if members:
+                pipe.zrem(source, *members)
+                pipe.zadd(target, {member: score for member in members})
+            return members
+
+        members = self.redis.transaction(move, source, value_from_callable=True)
+        return [member.decode() if isinstance(member, bytes) else member for member in members]
+
+    def pop_due(self, limit: int, now: Optional[float] = None) -> List[str]:
+        """
+        Забрать до limit наступивших элементов; после постановки задач
+        их нужно подтвердить через ack. Неподтвержденные вовремя элементы
+        возвращаются в очередь
+        """
+        now = time.time() if now is None else now
+        self._move(self.processing_key, self.key, now, limit, now)
+        return self._move(self.key, self.processing_key, now, limit, now + self.visibility_timeout)
+
+    def ack(self, members: List[str]) -> None:
+        """Задачи по элементам поставлены в брокер: удалить их насовсем"""
+        if members:
+            self.redis.zrem(self.processing_key, *members)
+
+    def __len__(self) -> int:
+        return self.redis.zcard(self.key)
+
+
+class MemoryDelayedQueue:
+    """Отложенная очередь в памяти процесса, с тем же интерфейсом"""
+
+    def __init__(self, visibility_timeout: float = 300.0):
+        self.visibility_timeout = visibility_timeout
+        self._heap: List[Tuple[float, str]] = []
+        self._members = set()
+        self._processing: Dict[str, float] = {}
+
+    def add_many(self, items: Iterable[Tuple[str, float]], batch_size: int = 1000) -> int:
+        added = 0
+        for member, due in items:
+            if member in self._members:
+                continue
+            self._members.add(member)
+            heapq.heappush(self._heap, (due, member))
+            added += 1
+        return added
+
+    def pop_due(self, limit: int, now: Optional[float] = None) -> List[str]:
+        now = time.time() if now is None else now
+        expired = [m for m, deadline in self._processing.items() if deadline <= now]
+        for member in expired:
+            del self._processing[member]
+        self.add_many((member, now) for member in expired)
+
+        members = []
+        while self._heap and len(members) < limit and self._heap[0][0] <= now:
+            _, member = heapq.heappop(self._heap)
+            self._members.discard(member)
+            self._processing[member] = now + self.visibility_timeout
+            members.append(member)
+        return members
+
+    def ack(self, members: List[str]) -> None:
+        for member in members:
+            self._processing.pop(member, None)
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+
+def create_delayed_queue(config: RedisConfig) -> Union[DelayedQueue, MemoryDelayedQueue]:
+    """
+    Очередь по config.delayed_queue: redis - общий Redis,
+    memory - куча в памяти процесса для тестов
+    """
+    if config.delayed_queue == "redis":
+        return DelayedQueue(Redis(host=config.host, port=config.port, db=config.db))
+    if config.delayed_queue == "memory":
+        return MemoryDelayedQueue()
+    raise ValueError(f"Неизвестная отложенная очередь: {config.delayed_queue}")
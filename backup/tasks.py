@@ -1,6 +1,8 @@
 import asyncio
+import json
 import logging
 import random
+from collections import defaultdict
 from datetime import datetime, timedelta
 
 from aiogram import Bot
@@ -11,7 +13,13 @@ from celery.schedules import crontab
 
 from celery_app import celery_app
 from config.config import load_config
-from database.repository import get_all_partner_pairs
+from database.database import engine
+from database.records import PairRecord
+from delayed_queue import create_delayed_queue
+from database.repository import (get_all_partner_pairs,
+                                 get_pairs_by_congratulation_ids)
+from middleware.throttling import setup_rate_limit
+from worker_loop import register_cleanup, run_async
 
 logger = logging.getLogger(__name__)
 
@@ -26,96 +34,98 @@ def get_config():
     return _config
 
 
+_bot = None
+
+
+def get_bot() -> Bot:
+    """Бот процесса воркера, один на все задачи: сессия aiohttp живет в loop процесса"""
+    global _bot
+    if _bot is None:
+        cfg = get_config()
+        # Темп отправки задает общий лимитер процесса воркера
+        _bot = setup_rate_limit(Bot(
+            token=cfg.bot.token,
+            default=DefaultBotProperties(parse_mode=ParseMode.HTML),
+        ))
+    return _bot
+
+
+async def _close_resources():
+    """Закрыть сессию бота и пул соединений БД при остановке воркера"""
+    global _bot
+    if _bot is not None:
+        await _bot.session.close()
+        _bot = None
+    await engine.dispose()
+
+
+register_cleanup(_close_resources)
+
+
+_delayed_queue = None
+
+
+def get_delayed_queue():
+    """Отложенная очередь отправки процесса (Redis ZSET из config.redis)"""
+    global _delayed_queue
+    if _delayed_queue is None:
+        _delayed_queue = create_delayed_queue(get_config().redis)
+    return _delayed_queue
+
+
 class AsyncTask(Task):
     """Класс для выполнения асинхронных задач в Celery"""
-    _bot = None
 
     @property
     def bot(self):
-        if self._bot is None:
-            cfg = get_config()
-            self._bot = Bot(
-                token=cfg.bot.token,
-                default=DefaultBotProperties(parse_mode=ParseMode.HTML),
-            )
-        return self._bot
+        return get_bot()
 
 
-@celery_app.task(base=AsyncTask, bind=True)
-def send_congratulations_to_pair(self, pair_data: dict):
-    """Отправка поздравлений паре партнеров - каждое поздравление приходит обоим партнерам"""
-    async def _send():
-        bot = self.bot
-        user1 = pair_data["user1"]
-        user2 = pair_data["user2"]
-        
-        # Отправляем поздравления от user1 обоим партнерам
-        for congrat in user1["congratulations"]:
-            try:
-                # Отправляем user1
-                if congrat["photo_file_id"]:
-                    await bot.send_photo(
-                        chat_id=user1["telegram_id"],
-                        photo=congrat["photo_file_id"],
-                        caption=congrat["message"]
-                    )
-                else:
-                    await bot.send_message(
-                        chat_id=user1["telegram_id"],
-                        text=congrat["message"]
-                    )
-                await asyncio.sleep(0.04)  # ~25 msg/сек
-                
-                # Отправляем user2
-                if congrat["photo_file_id"]:
-                    await bot.send_photo(
-                        chat_id=user2["telegram_id"],
-                        photo=congrat["photo_file_id"],
-                        caption=congrat["message"]
-                    )
-                else:
-                    await bot.send_message(
-                        chat_id=user2["telegram_id"],
-                        text=congrat["message"]
-                    )
-                await asyncio.sleep(0.04)  # ~25 msg/сек
-            except Exception as e:
-                logger.error(f"Ошибка отправки поздравления от {user1['telegram_id']}: {e}")
-        
-        # Отправляем поздравления от user2 обоим партнерам
-        for congrat in user2["congratulations"]:
-            try:
-                # Отправляем user1
-                if congrat["photo_file_id"]:
+async def _send_pair(bot: Bot, pair: PairRecord):
+    """Каждое поздравление пары приходит обоим партнерам"""
+    for congrat in pair.congratulations:
+        try:
+            # Отправляем обоим партнерам
+            for chat_id in pair.recipients:
+                if congrat.photo_file_id:
                     await bot.send_photo(
-                        chat_id=user1["telegram_id"],
-                        photo=congrat["photo_file_id"],
-                        caption=congrat["message"]
+                        chat_id=chat_id,
+                        photo=congrat.photo_file_id,
+                        caption=congrat.message
                     )
                 else:
                     await bot.send_message(
-                        chat_id=user1["telegram_id"],
-                        text=congrat["message"]
+                        chat_id=chat_id,
+                        text=congrat.message
                     )
-                await asyncio.sleep(0.04)  # ~25 msg/сек
-                
-                # Отправляем user2
-                if congrat["photo_file_id"]:
-                    await bot.send_photo(
-                        chat_id=user2["telegram_id"],
-                        photo=congrat["photo_file_id"],
-                        caption=congrat["message"]
-                    )
-                else:
-                    await bot.send_message(
-                        chat_id=user2["telegram_id"],
-                        text=congrat["message"]
-                    )
-                await asyncio.sleep(0.04)  # ~25 msg/сек
-            except Exception as e:
-                logger.error(f"Ошибка отправки поздравления от {user2['telegram_id']}: {e}")
-    
-    asyncio.run(_send())
+        except Exception as e:
+            logger.error(f"Ошибка отправки поздравления от {congrat.sender_name}: {e}")
+
+
+@celery_app.task(base=AsyncTask, bind=True)
+def send_congratulations_to_pair(self, pair_data: dict):
+    """
+    Отправка поздравлений паре партнеров по полной записи пары.
+    Оставлена для задач, поставленных в очередь до перехода на send_congratulations_chunk,
+    в том числе в старом формате {"user1": {...}, "user2": {...}}
+    """
+    # Celery передает JSON, восстанавливаем запись пары
+    pair = PairRecord.from_json(pair_data)
+    run_async(_send_pair(self.bot, pair))
+
+
+@celery_app.task(base=AsyncTask, bind=True)
+def send_congratulations_chunk(self, congratulation_ids: list[int]):
+    """
+    Отправка пачки поздравлений по их id.
+    В брокере лежат только id, тексты и получатели читаются одним запросом
+    """
+    async def _send():
+        pairs = await get_pairs_by_congratulation_ids(congratulation_ids)
+        # Темп задает лимитер бота, пары отправляем одновременно
+        await asyncio.gather(*(_send_pair(self.bot, pair) for pair in pairs))
+
+    run_async(_send())
 
 
 @celery_app.task
@@ -128,41 +138,78 @@ def schedule_all_congratulations():
         return
     
     async def _schedule():
-        pairs = await get_all_partner_pairs()
-        
-        if not pairs:
-            logger.info("Нет пар партнеров для отправки поздравлений")
-            return
-        
         # Первое сообщение в 00:00 01.01.2026
         first_send_time = datetime(2026, 1, 1, 0, 0, 0)
         
         # Конечная дата - 13.01.2026 23:59:59
         end_date = datetime(2026, 1, 13, 23, 59, 59)
-        
-        # Генерируем случайные времена для каждой пары
-        for pair in pairs:
+        window_seconds = int((end_date - first_send_time).total_seconds())
+
+        # id поздравлений по минуте отправки: поздравления одной минуты
+        # уходят общими задачами по chunk_size штук
+        by_minute: dict[int, list[int]] = defaultdict(list)
+
+        # Генерируем случайные времена для каждой пары по мере чтения из базы
+        total_pairs = 0
+        async for pair in get_all_partner_pairs():
+            total_pairs += 1
+            congrat_ids = [congrat.id for congrat in pair.congratulations]
+            if not congrat_ids:
+                continue
             # Первое сообщение в 00:00
-            send_congratulations_to_pair.apply_async(
-                args=[pair],
-                eta=first_send_time
-            )
-            
+            by_minute[0].extend(congrat_ids)
+
             # Генерируем 2-3 дополнительных сообщения в случайное время до 13.01.2026
             num_additional = random.randint(2, 3)
             for _ in range(num_additional):
                 # Случайное время между 01.01.2026 00:01 и 13.01.2026 23:59
-                random_seconds = random.randint(60, int((end_date - first_send_time).total_seconds()))
-                random_time = first_send_time + timedelta(seconds=random_seconds)
-                
-                send_congratulations_to_pair.apply_async(
-                    args=[pair],
-                    eta=random_time
-                )
-        
-        logger.info(f"Запланирована отправка поздравлений для {len(pairs)} пар")
+                random_seconds = random.randint(60, window_seconds)
+                by_minute[random_seconds // 60].extend(congrat_ids)
+
+        if not total_pairs:
+            logger.info("Нет пар партнеров для отправки поздравлений")
+            return
+
+        # Пачки ждут своего времени в отложенной очереди, а не в воркерах
+        chunk_size = get_config().scheduler.task_chunk_size
+        chunks = (
+            (
+                json.dumps({"minute": minute, "n": i, "ids": congrat_ids[i:i + chunk_size]}),
+                (first_send_time + timedelta(minutes=minute)).timestamp(),
+            )
+            for minute, congrat_ids in sorted(by_minute.items())
+            for i in range(0, len(congrat_ids), chunk_size)
+        )
+        total_tasks = get_delayed_queue().add_many(chunks)
+
+        logger.info(
+            f"Запланирована отправка поздравлений для {total_pairs} пар, задач: {total_tasks}"
+        )
     
-    asyncio.run(_schedule())
+    run_async(_schedule())
+
+
+@celery_app.task
+def move_due_congratulations(batch_size: int = 500):
+    """Перенос наступивших пачек из отложенной очереди в очередь задач"""
+    queue = get_delayed_queue()
+    moved = 0
+    while True:
+        members = queue.pop_due(batch_size)
+        enqueued = []
+        try:
+            for member in members:
+                send_congratulations_chunk.delay(json.loads(member)["ids"])
+                enqueued.append(member)
+        finally:
+            # Неподтвержденные пачки вернутся в очередь по visibility_timeout
+            queue.ack(enqueued)
+        moved += len(members)
+        if len(members) < batch_size:
+            break
+    if moved:
+        logger.info(f"В очередь отправки передано задач: {moved}")
+    return moved
 
 
 # Настройка расписания Celery Beat - запускаем планировщик в 00:00 01.01.2026
@@ -173,5 +220,10 @@ celery_app.conf.beat_schedule = {
         "schedule": crontab(hour=0, minute=0, day_of_month=1, month_of_year=1),
         "args": (),
     },
+    # Поллер отложенной очереди: наступившие пачки уходят воркерам
+    "move-due-congratulations": {
+        "task": "tasks.move_due_congratulations",
+        "schedule": 5.0,
+    },
 }
 
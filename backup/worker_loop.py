@@ -0,0 +1,80 @@
+"""
+Один долгоживущий event loop на процесс воркера Celery.
+
+Loop крутится в отдельном потоке, задачи передают в него корутины через
+run_async. Сессия aiohttp бота и пул соединений asyncpg привязаны к этому
+loop, поэтому создаются один раз и переиспользуются всеми задачами процесса,
+а не открываются заново в каждом asyncio.run.
+"""
+import asyncio
+import logging
+import threading
+from typing import Awaitable, Callable, List, Optional, TypeVar
+
+from celery.signals import worker_process_init, worker_process_shutdown, worker_shutdown
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_thread: Optional[threading.Thread] = None
+_lock = threading.Lock()
+# Корутины, закрывающие ресурсы процесса (сессия бота, пул БД), при остановке воркера
+_cleanups: List[Callable[[], Awaitable[None]]] = []
+
+
+def get_loop() -> asyncio.AbstractEventLoop:
+    """Event loop процесса, запускается при первом обращении"""
+    global _loop, _thread
+    with _lock:
+        if _loop is None or _loop.is_closed():
+            _loop = asyncio.new_event_loop()
+            _thread = threading.Thread(
+                target=_loop.run_forever, name="celery-event-loop", daemon=True
+            )
+            _thread.start()
+        return _loop
+
+
+def run_async(coro: Awaitable[T]) -> T:
+    """Выполнить корутину в loop процесса и дождаться результата"""
+    return asyncio.run_coroutine_threadsafe(coro, get_loop()).result()
+
+
+def register_cleanup(cleanup: Callable[[], Awaitable[None]]) -> None:
+    """Добавить корутину, которая выполнится в loop при остановке воркера"""
+    _cleanups.append(cleanup)
+
+
+def shutdown() -> None:
+    """Закрыть ресурсы процесса и остановить loop"""
+    global _loop, _thread
+    with _lock:
+        loop, thread = _loop, _thread
+        _loop = _thread = None
+    if loop is None or loop.is_closed():
+        return
+
+    for cleanup in reversed(_cleanups):
+        try:
+            asyncio.run_coroutine_threadsafe(cleanup(), loop).result(timeout=30)
+        except Exception as e:
+            logger.warning(f"Ошибка при остановке воркера: {e}")
+
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join(timeout=30)
+    loop.close()
+
+
+@worker_process_init.connect
+def _reset_after_fork(**kwargs) -> None:
+    # Дочерний процесс prefork получает копию loop без потока: начинаем заново
+    global _loop, _thread
+    _loop = _thread = None
+
+
+@worker_process_shutdown.connect
+@worker_shutdown.connect
+def _shutdown_worker(**kwargs) -> None:
+    shutdown()
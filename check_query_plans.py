@@ -0,0 +1,269 @@
+"""
+Проверка планов запросов репозитория.
+
+Скрипт создает отдельную базу на локальном PostgreSQL (настройки из .env),
+применяет миграции Alembic, заполняет таблицы тестовыми данными и вызывает
+функции из database/repository.py. Каждый выполненный ими SQL-запрос
+прогоняется через EXPLAIN с выключенным enable_seqscan: если планировщику
+все равно приходится читать таблицу целиком, значит подходящего индекса нет.
+
+При появлении Seq Scan скрипт завершается с кодом 1.
+
+Запуск:
+    python check_query_plans.py            # база query_plan_check, удаляется после проверки
+    python check_query_plans.py --keep     # оставить базу для ручного разбора
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+from datetime import datetime, timedelta
+
+import asyncpg
+
+from config.config import load_config
+
+CHECK_DB_NAME = "query_plan_check"
+SEED_USERS = 2000
+
+# Запросы, которые читают таблицу целиком намеренно
+ALLOWED_FULL_SCANS = {
+    "get_all_chat_ids": {"users"},  # рассылка всем пользователям
+    "get_all_partner_pairs": {"pairs"},  # список всех пар
+    "get_all_partner_pairs(unplanned_only)": {"pairs"},
+    "create_broadcast": {"users"},  # число получателей рассылки
+    "get_running_broadcasts": {"broadcasts"},  # таблица из единиц строк
+}
+
+SEED_SQL = [
+    # Пользователи попарно выбирают друг друга: (1, 2), (3, 4), ...
+    """
+    INSERT INTO users (id, telegram_id, first_name, partner_id)
+    SELECT g, 1000000 + g, 'user' || g, CASE WHEN g % 2 = 1 THEN g + 1 ELSE g - 1 END
+    FROM generate_series(1, {n}) g
+    """,
+    """
+    INSERT INTO pairs (user_low_id, user_high_id)
+    SELECT g, g + 1 FROM generate_series(1, {n}, 2) g
+    """,
+    """
+    INSERT INTO congratulations (sender_id, message, photo_file_id)
+    SELECT (g % {n}) + 1, 'message ' || g, CASE WHEN g % 3 = 0 THEN 'photo' || g END
+    FROM generate_series(1, {n} * 2) g
+    """,
+    """
+    INSERT INTO events (creator_id, partner_id, question, options, correct_option_id,
+                        telegram_poll_id, is_completed)
+    SELECT g, g + 1, 'question', ARRAY['a', 'b'], 0, 'poll' || g, false
+    FROM generate_series(1, {n}, 2) g
+    """,
+    # Половина поздравлений уже в outbox, часть доставок наступила
+    """
+    INSERT INTO deliveries (congratulation_id, recipient_id, send_at, status, attempts)
+    SELECT c.id, u.telegram_id,
+           now() + (c.id - {n} / 2) * interval '1 minute',
+           CASE WHEN c.id % 10 = 0 THEN 'sent' ELSE 'pending' END, 0
+    FROM congratulations c
+    JOIN users u ON u.id = c.sender_id
+    WHERE c.id <= {n}
+    """,
+    "ANALYZE",
+]
+
+
+def find_seq_scans(plan: dict) -> list[str]:
+    """Таблицы, которые план читает через Seq Scan"""
+    tables = []
+    if plan.get("Node Type") == "Seq Scan":
+        tables.append(plan.get("Relation Name", "?"))
+    for child in plan.get("Plans", []):
+        tables.extend(find_seq_scans(child))
+    return tables
+
+
+async def recreate_database(db_name: str, drop_only: bool = False) -> None:
+    cfg = load_config().db
+    conn = await asyncpg.connect(
+        host=cfg.host, port=cfg.port, user=cfg.user, password=cfg.password,
+        database="postgres",
+    )
+    try:
+        await conn.execute(f'DROP DATABASE IF EXISTS "{db_name}"')
+        if not drop_only:
+            await conn.execute(f'CREATE DATABASE "{db_name}"')
+    finally:
+        await conn.close()
+
+
+async def run_checks() -> list[tuple[str, str, list[str]]]:
+    """
+    Вызвать функции репозитория, собрать их SQL и проверить планы.
+    Возвращает список (функция, запрос, таблицы с Seq Scan).
+    """
+    # Импортируем после подмены DB_NAME, чтобы движок смотрел на проверочную базу
+    from sqlalchemy import event, text
+
+    from database.database import async_session, engine, init_db
+    from database.repository import (CongratulationRepository, EventRepository,
+                                     UserRepository, checkpoint_broadcast,
+                                     claim_due_deliveries, complete_delivery,
+                                     claim_broadcast, create_broadcast,
+                                     extend_broadcast_lease,
+                                     get_all_chat_ids,
+                                     get_all_partner_pairs, get_broadcast,
+                                     get_chat_ids_after,
+                                     get_congratulations_after,
+                                     get_last_broadcast,
+                                     get_max_congratulation_id,
+                                     get_pairs_by_congratulation_ids,
+                                     get_planned_load,
+                                     get_running_broadcasts, mark_chats_blocked,
+                                     renew_delivery_claims,
+                                     reset_queued_deliveries)
+
+    engine.echo = False
+    await init_db()
+    async with engine.begin() as conn:
+        for sql in SEED_SQL:
+            await conn.execute(text(sql.format(n=SEED_USERS)))
+
+    captured: list[tuple[str, str, tuple]] = []
+    current = {"label": None}
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if current["label"] and not executemany:
+            captured.append((current["label"], statement, parameters))
+
+    event.listen(engine.sync_engine, "before_cursor_execute", capture)
+
+    async def with_session(call):
+        async with async_session() as session:
+            return await call(session)
+
+    calls = {
+        "UserRepository.get_user": lambda: with_session(
+            lambda s: UserRepository(s).get_user(1000001)
+        ),
+        "UserRepository.get_user_by_id": lambda: with_session(
+            lambda s: UserRepository(s).get_user_by_id(5)
+        ),
+        "UserRepository.get_partner": lambda: with_session(
+            lambda s: UserRepository(s).get_partner(1000003)
+        ),
+        "UserRepository.create_pair": lambda: with_session(
+            lambda s: UserRepository(s).create_pair(1000005, 1000006)
+        ),
+        "EventRepository.get_event_by_poll_id": lambda: with_session(
+            lambda s: EventRepository(s).get_event_by_poll_id("poll7")
+        ),
+        "EventRepository.mark_event_completed": lambda: with_session(
+            lambda s: EventRepository(s).mark_event_completed(1)
+        ),
+        "CongratulationRepository.list_by_sender": lambda: with_session(
+            lambda s: CongratulationRepository(s).list_by_sender(3)
+        ),
+        "get_all_chat_ids": get_all_chat_ids,
+        "mark_chats_blocked": lambda: mark_chats_blocked([1000007, 1000009]),
+        "UserRepository.unblock_user": lambda: with_session(
+            lambda s: UserRepository(s).unblock_user(1000007)
+        ),
+        "get_all_partner_pairs": lambda: _drain(get_all_partner_pairs()),
+        "get_all_partner_pairs(unplanned_only)": lambda: _drain(
+            get_all_partner_pairs(unplanned_only=True)
+        ),
+        "get_max_congratulation_id": lambda: get_max_congratulation_id(
+            datetime.now().astimezone()
+        ),
+        "get_planned_load": lambda: get_planned_load(datetime.now().astimezone()),
+        "get_pairs_by_congratulation_ids": lambda: get_pairs_by_congratulation_ids(
+            range(1, 201)
+        ),
+        "get_congratulations_after": lambda: get_congratulations_after(
+            SEED_USERS // 2, 500
+        ),
+        "claim_due_deliveries": lambda: claim_due_deliveries(
+            datetime.now().astimezone(), 50
+        ),
+        "complete_delivery": lambda: complete_delivery(1, None),
+        "renew_delivery_claims": lambda: renew_delivery_claims(
+            range(1, 201), datetime.now().astimezone(), datetime.now().astimezone()
+        ),
+        "reset_queued_deliveries": reset_queued_deliveries,
+        "get_chat_ids_after": lambda: get_chat_ids_after(SEED_USERS // 2, 500),
+        "create_broadcast": lambda: create_broadcast("check", timedelta(minutes=2)),
+        "claim_broadcast": lambda: claim_broadcast(1, timedelta(minutes=2)),
+        "extend_broadcast_lease": lambda: extend_broadcast_lease(1, timedelta(minutes=2)),
+        "get_broadcast": lambda: get_broadcast(1),
+        "get_last_broadcast": get_last_broadcast,
+        "get_running_broadcasts": get_running_broadcasts,
+        "checkpoint_broadcast": lambda: checkpoint_broadcast(
+            1, 500, 500, 0, lease=timedelta(minutes=2)
+        ),
+    }
+
+    for label, call in calls.items():
+        current["label"] = label
+        await call()
+    current["label"] = None
+    event.remove(engine.sync_engine, "before_cursor_execute", capture)
+
+    results = []
+    async with engine.connect() as conn:
+        await conn.exec_driver_sql("SET enable_seqscan = off")
+        for label, statement, parameters in captured:
+            keyword = statement.lstrip().split(None, 1)[0].upper()
+            if keyword not in ("SELECT", "UPDATE", "DELETE", "INSERT", "WITH"):
+                continue
+            result = await conn.exec_driver_sql(
+                f"EXPLAIN (FORMAT JSON) {statement}", parameters
+            )
+            plan = result.scalar()
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            tables = [
+                t for t in find_seq_scans(plan[0]["Plan"])
+                if t not in ALLOWED_FULL_SCANS.get(label, set())
+            ]
+            results.append((label, " ".join(statement.split()), tables))
+        await conn.rollback()
+
+    await engine.dispose()
+    return results
+
+
+async def _drain(iterator) -> None:
+    async for _ in iterator:
+        pass
+
+
+async def main() -> int:
+    parser = argparse.ArgumentParser(description="Проверка планов запросов репозитория")
+    parser.add_argument("--database", default=CHECK_DB_NAME)
+    parser.add_argument("--keep", action="store_true", help="не удалять базу после проверки")
+    args = parser.parse_args()
+
+    await recreate_database(args.database)
+    os.environ["DB_NAME"] = args.database
+    try:
+        results = await run_checks()
+    finally:
+        if not args.keep:
+            await recreate_database(args.database, drop_only=True)
+
+    failed = 0
+    for label, statement, tables in results:
+        if tables:
+            failed += 1
+            print(f"❌ {label}: Seq Scan по {', '.join(tables)}")
+            print(f"   {statement[:300]}")
+        else:
+            print(f"✅ {label}")
+
+    print("=" * 50)
+    print(f"Проверено запросов: {len(results)}, с Seq Scan: {failed}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -8,6 +8,15 @@ class TgBot:
     token: str  # Токен для доступа к телеграм-боту
 
 
+@dataclass
+class WebhookConfig:
+    url: str  # Внешний адрес бота "https://bot.example.com"; пусто - режим поллинга
+    path: str  # Путь вебхука на сервере
+    host: str  # Адрес, на котором слушает aiohttp
+    port: int  # Порт aiohttp (открыт в Dockerfile)
+    secret: str  # Секрет заголовка X-Telegram-Bot-Api-Secret-Token (пусто - без проверки)
+
+
 @dataclass
 class DatabaseConfig:
     host: str
@@ -15,6 +24,19 @@ class DatabaseConfig:
     user: str
     password: str
     database: str
+    pool_size: int = 10
+    max_overflow: int = 10
+    pool_timeout: float = 30.0  # Сколько ждать свободное соединение, сек
+    pool_pre_ping: bool = True
+    statement_cache_size: int = 100  # Кэш подготовленных выражений asyncpg
+    echo: bool = False  # Логировать SQL запросы
+
+    @property
+    def url(self) -> str:
+        return (
+            f"postgresql+asyncpg://{self.user}:{self.password}"
+            f"@{self.host}:{self.port}/{self.database}"
+        )
 
 
 @dataclass
@@ -22,6 +44,35 @@ class RedisConfig:
     host: str
     port: int
     db: int
+    fsm_storage: str  # Хранилище FSM: memory, redis или fakeredis (тесты)
+    fsm_ttl: int  # Сколько секунд хранить незавершенный диалог (0 - бессрочно)
+    delayed_queue: str  # Отложенная очередь Celery: redis или memory (тесты, один процесс)
+
+
+@dataclass
+class UserCacheConfig:
+    maxsize: int  # Сколько пользователей держать в кэше
+    ttl: float  # Время жизни записи, сек
+
+
+@dataclass
+class RateLimitConfig:
+    global_rate: float  # Сообщений в секунду на весь бот
+    per_chat_rate: float  # Сообщений в секунду в один чат
+    per_chat_burst: float  # Сколько сообщений подряд в один чат уходят без паузы
+
+
+@dataclass
+class SchedulerConfig:
+    coalesce_window: float  # Окно склейки поздравлений пары, сек (0 - выключено)
+    send_share: float  # Доля глобального лимита, отдаваемая плановой отправке
+    quiet_hours: tuple[int, int] | None  # Часы [начало, конец) без отправки, "2,8"
+    planning_interval: float  # Период проверки новых поздравлений, сек
+    leader_lock_key: int  # Ключ advisory-lock лидера, общий для всех реплик
+    leader_check_interval: float  # Период проверки лока лидера, сек
+    external_workers: bool  # Отправляют процессы delivery_worker.py, бот только планирует
+    claim_lease: float  # Через сколько секунд доставка, зависшая в queued, забирается снова
+    task_chunk_size: int  # Поздравлений в одной задаче Celery (backup/tasks.py)
 
 
 @dataclass
@@ -33,27 +84,79 @@ class LogSettings:
 @dataclass
 class Config:
     bot: TgBot
+    webhook: WebhookConfig
     db: DatabaseConfig
     redis: RedisConfig
+    limits: RateLimitConfig
+    cache: UserCacheConfig
+    scheduler: SchedulerConfig
     log: LogSettings
 
 
+def _parse_quiet_hours(value: str) -> tuple[int, int] | None:
+    """Тихие часы "начало,конец": ровно два часа от 0 до 23"""
+    if not value:
+        return None
+    hours = tuple(int(hour) for hour in value.split(","))
+    if len(hours) != 2 or not all(0 <= hour <= 23 for hour in hours):
+        raise ValueError(
+            f"SCHEDULER_QUIET_HOURS: нужны два часа от 0 до 23 через запятую, получено {value!r}"
+        )
+    return hours
+
+
 def load_config(path: str | None = None) -> Config:
     env = Env()
     env.read_env(path)
     return Config(
         bot=TgBot(token=env("BOT_TOKEN")),
+        webhook=WebhookConfig(
+            url=env("WEBHOOK_URL", ""),
+            path=env("WEBHOOK_PATH", "/webhook"),
+            host=env("WEBAPP_HOST", "0.0.0.0"),
+            port=env.int("WEBAPP_PORT", 8080),
+            secret=env("WEBHOOK_SECRET", ""),
+        ),
         db=DatabaseConfig(
             host=env("DB_HOST"),
             port=env.int("DB_PORT"),
             user=env("DB_USER", "postgres"),
             password=env("DB_PASSWORD", ""),
             database=env("DB_NAME", "year_summary_bot"),
+            pool_size=env.int("DB_POOL_SIZE", 10),
+            max_overflow=env.int("DB_MAX_OVERFLOW", 10),
+            pool_timeout=env.float("DB_POOL_TIMEOUT", 30.0),
+            pool_pre_ping=env.bool("DB_POOL_PRE_PING", True),
+            statement_cache_size=env.int("DB_STATEMENT_CACHE_SIZE", 100),
+            echo=env.bool("DB_ECHO", False),
         ),
         redis=RedisConfig(
             host=env("REDIS_HOST", "localhost"),
             port=env.int("REDIS_PORT", 6379),
             db=env.int("REDIS_DB", 0),
+            fsm_storage=env("FSM_STORAGE", "memory"),
+            fsm_ttl=env.int("FSM_TTL", 7 * 24 * 3600),
+            delayed_queue=env("DELAYED_QUEUE", "redis"),
+        ),
+        limits=RateLimitConfig(
+            global_rate=env.float("TG_GLOBAL_RATE", 30.0),
+            per_chat_rate=env.float("TG_PER_CHAT_RATE", 1.0),
+            per_chat_burst=env.float("TG_PER_CHAT_BURST", 3.0),
+        ),
+        cache=UserCacheConfig(
+            maxsize=env.int("USER_CACHE_SIZE", 10000),
+            ttl=env.float("USER_CACHE_TTL", 300.0),
+        ),
+        scheduler=SchedulerConfig(
+            coalesce_window=env.float("SCHEDULER_COALESCE_WINDOW", 0.0),
+            send_share=env.float("SCHEDULER_SEND_SHARE", 0.8),
+            quiet_hours=_parse_quiet_hours(env("SCHEDULER_QUIET_HOURS", "")),
+            planning_interval=env.float("SCHEDULER_PLANNING_INTERVAL", 60.0),
+            leader_lock_key=env.int("SCHEDULER_LEADER_LOCK_KEY", 20260101),
+            leader_check_interval=env.float("SCHEDULER_LEADER_CHECK_INTERVAL", 2.0),
+            external_workers=env.bool("SCHEDULER_EXTERNAL_WORKERS", False),
+            claim_lease=env.float("SCHEDULER_CLAIM_LEASE", 600.0),
+            task_chunk_size=env.int("SCHEDULER_TASK_CHUNK_SIZE", 200),
         ),
         log=LogSettings(level=env("LOG_LEVEL"), format=env("LOG_FORMAT")),
     )
@@ -0,0 +1,87 @@
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from sqlalchemy import inspect
+from sqlalchemy.orm import make_transient_to_detached
+
+from .database import config
+from .models import User
+
+
+def _snapshot(user: User) -> User:
+    """Отсоединенная копия пользователя: не зависит от сессии, в которой был загружен"""
+    copy = User(**{attr.key: getattr(user, attr.key) for attr in inspect(User).column_attrs})
+    make_transient_to_detached(copy)
+    return copy
+
+
+class UserCache:
+    """
+    Процессный LRU-кэш пользователей по telegram_id с ограниченным временем жизни.
+    Хранит отсоединенные копии объектов User; репозиторий присоединяет их
+    к своей сессии через merge(load=False), без обращения к базе.
+    """
+
+    def __init__(self, maxsize: int = 10000, ttl: float = 300.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._items: "OrderedDict[int, tuple[float, User]]" = OrderedDict()
+        self._telegram_ids: Dict[int, int] = {}  # users.id -> telegram_id
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, telegram_id: int) -> Optional[User]:
+        entry = self._items.get(telegram_id)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        expires_at, user = entry
+        if expires_at < time.monotonic():
+            self.invalidate(telegram_id)
+            self.misses += 1
+            return None
+
+        self._items.move_to_end(telegram_id)
+        self.hits += 1
+        return user
+
+    def get_by_id(self, user_id: int) -> Optional[User]:
+        telegram_id = self._telegram_ids.get(user_id)
+        if telegram_id is None:
+            self.misses += 1
+            return None
+        return self.get(telegram_id)
+
+    def put(self, user: User) -> None:
+        self._items[user.telegram_id] = (time.monotonic() + self.ttl, _snapshot(user))
+        self._items.move_to_end(user.telegram_id)
+        self._telegram_ids[user.id] = user.telegram_id
+
+        while len(self._items) > self.maxsize:
+            _, (_, evicted) = self._items.popitem(last=False)
+            self._telegram_ids.pop(evicted.id, None)
+
+    def invalidate(self, *telegram_ids: int) -> None:
+        for telegram_id in telegram_ids:
+            entry = self._items.pop(telegram_id, None)
+            if entry is not None:
+                self._telegram_ids.pop(entry[1].id, None)
+
+    def clear(self) -> None:
+        self._items.clear()
+        self._telegram_ids.clear()
+
+    def stats(self) -> Dict[str, float]:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._items),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+        }
+
+
+user_cache = UserCache(maxsize=config.cache.maxsize, ttl=config.cache.ttl)
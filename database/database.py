@@ -1,28 +1,210 @@
+import asyncio
+import logging
+from pathlib import Path
+from typing import Optional
+
+from alembic import command
+from alembic.config import Config as AlembicConfig
 from config.config import Config, load_config
-from sqlalchemy.ext.asyncio import (AsyncSession, async_sessionmaker,
-                                    create_async_engine)
+from sqlalchemy import event, func, inspect, select, text
+from sqlalchemy.engine import Connection
+from sqlalchemy.ext.asyncio import (AsyncConnection, AsyncSession,
+                                    async_sessionmaker, create_async_engine)
+from sqlalchemy.orm import ORMExecuteState, Session
+
+from .pool import TimedQueuePool, pool_stats
 
-from .models import Base
+logger = logging.getLogger(__name__)
 
 config: Config = load_config()
 
-# Создаем асинхронный движок для PostgreSQL
+# Создаем асинхронный движок для PostgreSQL, параметры пула берутся из конфигурации
 engine = create_async_engine(
-    f"postgresql+asyncpg://{config.db.user}:{config.db.password}@{config.db.host}:{config.db.port}/{config.db.database}",
-    echo=True,  # Включаем логирование SQL запросов (можно отключить в проде)
+    config.db.url,
+    echo=config.db.echo,
+    poolclass=TimedQueuePool,
+    pool_size=config.db.pool_size,
+    max_overflow=config.db.max_overflow,
+    pool_timeout=config.db.pool_timeout,
+    pool_pre_ping=config.db.pool_pre_ping,
+    connect_args={"statement_cache_size": config.db.statement_cache_size},
 )
 
 # Создаем фабрику сессий
 async_session = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
 
-__all__ = ["async_session", "get_session", "init_db"]
+
+@event.listens_for(Session, "do_orm_execute")
+def _track_writes(orm_execute_state: ORMExecuteState) -> None:
+    # Core-запросы update()/delete()/insert() не попадают в session.dirty
+    if not orm_execute_state.is_select:
+        orm_execute_state.session.info["has_writes"] = True
+
+
+def session_has_writes(session: AsyncSession) -> bool:
+    """Есть ли в сессии незакоммиченные изменения"""
+    return bool(
+        session.new
+        or session.dirty
+        or session.deleted
+        or session.sync_session.info.get("has_writes")
+    )
+
+
+@event.listens_for(Session, "after_flush")
+def _track_flush(session: Session, flush_context) -> None:
+    # После autoflush объекты уходят из session.new/dirty, но транзакция не закоммичена
+    session.info["has_writes"] = True
+
+
+@event.listens_for(Session, "after_commit")
+@event.listens_for(Session, "after_rollback")
+def _reset_writes(session: Session) -> None:
+    session.info.pop("has_writes", None)
+
+
+ALEMBIC_INI = Path(__file__).resolve().parent.parent / "alembic.ini"
+# Ревизия, соответствующая схеме, которую раньше создавал create_all
+BASELINE_REVISION = "0001"
+
+
+def _upgrade_to_head(connection: Connection) -> None:
+    alembic_cfg = AlembicConfig(str(ALEMBIC_INI))
+    alembic_cfg.attributes["connection"] = connection
+
+    # База создана до появления миграций: помечаем исходную схему как примененную
+    tables = inspect(connection).get_table_names()
+    if "users" in tables and "alembic_version" not in tables:
+        command.stamp(alembic_cfg, BASELINE_REVISION)
+
+    command.upgrade(alembic_cfg, "head")
 
 
 async def init_db():
-    """Инициализация базы данных, создание таблиц"""
+    """Инициализация базы данных: применяем миграции Alembic до последней версии"""
     async with engine.begin() as conn:
-        # Создаем все таблицы, если их нет
-        await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(_upgrade_to_head)
+
+
+def get_pool_stats() -> dict:
+    """Метрики пула соединений для админских команд"""
+    return pool_stats(engine.pool)
+
+
+class LeaderLock:
+    """
+    Выбор лидера среди реплик бота через сессионный advisory-lock Postgres.
+
+    Лок держится на отдельном соединении все время лидерства. Если процесс
+    лидера падает, Postgres закрывает соединение и снимает лок, и его забирает
+    резервная реплика при следующей попытке (раз в check_interval секунд).
+    Лидер сам проверяет соединение с тем же периодом и уступает, если оно оборвано
+    или не отвечает max_slow_probes периодов подряд.
+    """
+
+    # Keepalive на стороне сервера: обрыв связи с лидером заметен за секунды
+    KEEPALIVE_SQL = (
+        "SET tcp_keepalives_idle = 5",
+        "SET tcp_keepalives_interval = 2",
+        "SET tcp_keepalives_count = 3",
+    )
+
+    def __init__(self, key: int, check_interval: float = 2.0, max_slow_probes: int = 5):
+        self.key = key
+        self.check_interval = check_interval
+        # Сколько периодов подряд проверка может висеть без ответа, прежде чем уступить
+        self.max_slow_probes = max_slow_probes
+        self._conn: Optional[AsyncConnection] = None
+
+    @property
+    def is_held(self) -> bool:
+        return self._conn is not None
+
+    async def _try_acquire(self) -> bool:
+        conn = await engine.connect()
+        try:
+            for sql in self.KEEPALIVE_SQL:
+                await conn.execute(text(sql))
+            result = await conn.execute(select(func.pg_try_advisory_lock(self.key)))
+            acquired = bool(result.scalar())
+            # Лок сессионный, транзакцию не держим открытой
+            await conn.commit()
+        except Exception:
+            await conn.invalidate()
+            raise
+        if not acquired:
+            await conn.close()
+            return False
+        self._conn = conn
+        return True
+
+    async def acquire(self) -> None:
+        """Дождаться лидерства"""
+        while True:
+            try:
+                if await self._try_acquire():
+                    return
+            except Exception as e:
+                logger.warning(f"Не удалось проверить лок лидера: {e}")
+            await asyncio.sleep(self.check_interval)
+
+    async def wait_lost(self) -> None:
+        """
+        Проверять соединение с локом, вернуться, когда лидерство потеряно.
+        Ошибка проверки - соединение оборвано, лок уже снят сервером. Медленный
+        ответ (пул или база под нагрузкой в пик) лидерство не отнимает: уступаем,
+        только если проверка висит max_slow_probes периодов подряд
+        """
+        probe: Optional[asyncio.Task] = None
+        slow = 0
+        try:
+            while True:
+                await asyncio.sleep(self.check_interval)
+                if probe is None:
+                    probe = asyncio.create_task(self._probe())
+                done, _ = await asyncio.wait({probe}, timeout=self.check_interval)
+                if done:
+                    error, probe = probe.exception(), None
+                    if error is None:
+                        slow = 0
+                        continue
+                else:
+                    # Проверку не прерываем: ждем ее ответа в следующем периоде
+                    slow += 1
+                    if slow < self.max_slow_probes:
+                        continue
+                    error = TimeoutError(f"нет ответа {slow} проверок подряд")
+
+                logger.warning(f"Соединение с локом лидера потеряно: {error}")
+                conn, self._conn = self._conn, None
+                try:
+                    await conn.invalidate()
+                except Exception:
+                    pass
+                return
+        finally:
+            if probe is not None:
+                probe.cancel()
+
+    async def _probe(self) -> None:
+        await self._conn.execute(text("SELECT 1"))
+        await self._conn.commit()
+
+    async def release(self) -> None:
+        """Уступить лидерство"""
+        if self._conn is None:
+            return
+        conn, self._conn = self._conn, None
+        try:
+            await conn.execute(select(func.pg_advisory_unlock(self.key)))
+            await conn.commit()
+            await conn.close()
+        except Exception:
+            # Соединение закрывается, вместе с ним сервер снимает лок
+            try:
+                await conn.invalidate()
+            except Exception:
+                pass
 
 
 async def get_session() -> AsyncSession:
@@ -31,4 +213,4 @@ async def get_session() -> AsyncSession:
         yield session
 
 
-__all__ = ["async_session", "get_session", "init_db"]
+__all__ = ["LeaderLock", "async_session", "get_pool_stats", "get_session", "init_db"]
@@ -1,10 +1,11 @@
 from datetime import datetime
 from typing import List, Optional
 
-from sqlalchemy import (ARRAY, JSON, BigInteger, Boolean, DateTime, ForeignKey,
-                        String, Text)
+from sqlalchemy import (ARRAY, JSON, BigInteger, Boolean, CheckConstraint,
+                        DateTime, ForeignKey, Index, Integer, String, Text,
+                        UniqueConstraint)
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
-from sqlalchemy.sql import func
+from sqlalchemy.sql import false, func
 
 
 class Base(DeclarativeBase):
@@ -22,7 +23,11 @@ class User(Base):
     first_name: Mapped[str] = mapped_column(String(100))
     last_name: Mapped[Optional[str]] = mapped_column(String(100))
     partner_id: Mapped[Optional[int]] = mapped_column(
-        BigInteger, ForeignKey("users.id"), nullable=True
+        BigInteger, ForeignKey("users.id"), nullable=True, index=True
+    )
+    # Бот заблокирован пользователем или чат удален: не отправляем, пока не вернется
+    is_blocked: Mapped[bool] = mapped_column(
+        Boolean, nullable=False, default=False, server_default=false()
     )
     created_at: Mapped[datetime] = mapped_column(
         DateTime(timezone=True), server_default=func.now()
@@ -48,6 +53,31 @@ class User(Base):
     )
 
 
+class Pair(Base):
+    """Модель пары партнеров, хранится в каноническом порядке user_low_id < user_high_id"""
+
+    __tablename__ = "pairs"
+    __table_args__ = (
+        UniqueConstraint("user_low_id", "user_high_id", name="uq_pairs_users"),
+        CheckConstraint("user_low_id < user_high_id", name="ck_pairs_order"),
+        Index("ix_pairs_user_high_id", "user_high_id"),
+    )
+
+    id: Mapped[int] = mapped_column(BigInteger, primary_key=True, autoincrement=True)
+    user_low_id: Mapped[int] = mapped_column(
+        BigInteger, ForeignKey("users.id", ondelete="CASCADE"), nullable=False
+    )
+    user_high_id: Mapped[int] = mapped_column(
+        BigInteger, ForeignKey("users.id", ondelete="CASCADE"), nullable=False
+    )
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), server_default=func.now()
+    )
+
+    user_low: Mapped["User"] = relationship("User", foreign_keys=[user_low_id])
+    user_high: Mapped["User"] = relationship("User", foreign_keys=[user_high_id])
+
+
 class Event(Base):
     """Модель ивента (воспоминания с фотографией)"""
 
@@ -55,10 +85,10 @@ class Event(Base):
 
     id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
     creator_id: Mapped[int] = mapped_column(
-        BigInteger, ForeignKey("users.id"), nullable=False
+        BigInteger, ForeignKey("users.id"), nullable=False, index=True
     )
     partner_id: Mapped[int] = mapped_column(
-        BigInteger, ForeignKey("users.id"), nullable=False
+        BigInteger, ForeignKey("users.id"), nullable=False, index=True
     )
 
     photo_file_id: Mapped[Optional[str]] = mapped_column(String(500))
@@ -97,3 +127,91 @@ class Congratulation(Base):
 
     # Только связь с пользователем
     sender: Mapped["User"] = relationship("User")
+
+
+# Покрывает и фильтр по sender_id, и сортировку list_by_sender
+Index(
+    "ix_congratulations_sender_id_created_at",
+    Congratulation.sender_id,
+    Congratulation.created_at.desc(),
+)
+
+
+class DeliveryStatus:
+    """Статусы доставки поздравления"""
+
+    PENDING = "pending"  # Ждет своего времени
+    QUEUED = "queued"  # Загружена в очередь планировщика
+    SENT = "sent"  # Доставлена
+    FAILED = "failed"  # Исчерпаны попытки
+
+
+class Delivery(Base):
+    """Модель доставки поздравления получателю (outbox планировщика)"""
+
+    __tablename__ = "deliveries"
+    __table_args__ = (
+        UniqueConstraint(
+            "congratulation_id", "recipient_id", name="uq_deliveries_congratulation_recipient"
+        ),
+        Index("ix_deliveries_status_send_at", "status", "send_at"),
+    )
+
+    id: Mapped[int] = mapped_column(BigInteger, primary_key=True, autoincrement=True)
+    congratulation_id: Mapped[int] = mapped_column(
+        ForeignKey("congratulations.id", ondelete="CASCADE"), nullable=False
+    )
+    # telegram_id получателя
+    recipient_id: Mapped[int] = mapped_column(BigInteger, nullable=False)
+
+    send_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
+    status: Mapped[str] = mapped_column(
+        String(20), nullable=False, default=DeliveryStatus.PENDING
+    )
+    attempts: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    # Когда доставку забрал диспетчер или воркер; queued дольше аренды - забираем снова
+    claimed_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True))
+    sent_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True))
+    # message_id отправленного сообщения в чате получателя
+    message_id: Mapped[Optional[int]] = mapped_column(BigInteger)
+    last_error: Mapped[Optional[str]] = mapped_column(Text)
+
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), server_default=func.now()
+    )
+
+    congratulation: Mapped["Congratulation"] = relationship("Congratulation")
+
+
+class BroadcastStatus:
+    """Статусы рассылки"""
+
+    RUNNING = "running"
+    DONE = "done"
+    CANCELLED = "cancelled"
+    FAILED = "failed"  # Прервана ошибкой; не продолжается автоматически
+
+
+class Broadcast(Base):
+    """Модель рассылки всем пользователям с контрольной точкой для продолжения"""
+
+    __tablename__ = "broadcasts"
+
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+    text: Mapped[str] = mapped_column(Text, nullable=False)
+    status: Mapped[str] = mapped_column(
+        String(20), nullable=False, default=BroadcastStatus.RUNNING
+    )
+    # users.id последнего обработанного получателя (keyset-пагинация)
+    last_user_id: Mapped[int] = mapped_column(BigInteger, nullable=False, default=0)
+    total: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    sent_count: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    failed_count: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    # До какого времени рассылку ведет процесс, который ее запустил или продолжил;
+    # после истечения аренды ее подхватывает другой процесс бота
+    lease_until: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True))
+
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), server_default=func.now()
+    )
+    finished_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True))
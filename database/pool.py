@@ -0,0 +1,55 @@
+import time
+from typing import Dict
+
+from sqlalchemy import exc
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+
+class PoolMetrics:
+    """Статистика ожидания соединений из пула"""
+
+    def __init__(self):
+        self.checkouts = 0
+        self.timeouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def record(self, wait: float) -> None:
+        self.checkouts += 1
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+
+    def reset(self) -> None:
+        self.__init__()
+
+
+pool_metrics = PoolMetrics()
+
+
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    """Пул соединений, который замеряет время ожидания соединения (включая подключение)"""
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except exc.TimeoutError:
+            pool_metrics.timeouts += 1
+            raise
+        pool_metrics.record(time.perf_counter() - started)
+        return connection
+
+
+def pool_stats(pool: TimedQueuePool) -> Dict[str, float]:
+    """Текущее состояние пула и накопленные метрики ожидания"""
+    checkouts = pool_metrics.checkouts
+    return {
+        "size": pool.size(),
+        "in_use": pool.checkedout(),
+        "idle": pool.checkedin(),
+        "overflow": max(0, pool.overflow()),
+        "checkouts": checkouts,
+        "timeouts": pool_metrics.timeouts,
+        "avg_wait_ms": round(pool_metrics.total_wait / checkouts * 1000, 2) if checkouts else 0.0,
+        "max_wait_ms": round(pool_metrics.max_wait * 1000, 2),
+    }
@@ -0,0 +1,97 @@
+"""
+Легкие неизменяемые записи, которые репозиторий отдает планировщику.
+
+Вместо вложенных словарей - dataclass со __slots__: меньше памяти на элемент
+при планировании больших кампаний и никаких промежуточных копий.
+Для Celery (JSON-сериализатор) есть to_json / from_json.
+"""
+from dataclasses import asdict, dataclass
+from typing import Dict, Optional, Tuple
+
+
+@dataclass(frozen=True, slots=True)
+class CongratRecord:
+    """Поздравление вместе с именем отправителя"""
+
+    id: int
+    sender_name: str
+    message: str
+    photo_file_id: Optional[str] = None
+
+    def to_json(self) -> Dict:
+        return asdict(self)
+
+    @classmethod
+    def from_json(cls, data: Dict) -> "CongratRecord":
+        return cls(**data)
+
+
+@dataclass(frozen=True, slots=True)
+class PairRecord:
+    """Пара партнеров (telegram_id обоих) и поздравления, написанные в паре"""
+
+    user1_id: int
+    user1_name: str
+    user2_id: int
+    user2_name: str
+    congratulations: Tuple[CongratRecord, ...] = ()
+
+    @property
+    def recipients(self) -> Tuple[int, int]:
+        """Каждое поздравление пары получают оба партнера"""
+        return self.user1_id, self.user2_id
+
+    def to_json(self) -> Dict:
+        data = asdict(self)
+        data["congratulations"] = list(data["congratulations"])
+        return data
+
+    @classmethod
+    def from_json(cls, data: Dict) -> "PairRecord":
+        if "user1" in data:
+            return cls._from_legacy_json(data)
+        return cls(**{
+            **data,
+            "congratulations": tuple(
+                CongratRecord.from_json(congrat) for congrat in data["congratulations"]
+            ),
+        })
+
+    @classmethod
+    def _from_legacy_json(cls, data: Dict) -> "PairRecord":
+        """
+        Старый формат задач Celery: {"user1": {...}, "user2": {...}}, у каждого
+        партнера свои поздравления без id. Такие задачи могут еще лежать в брокере
+        """
+        user1, user2 = data["user1"], data["user2"]
+        return cls(
+            user1_id=user1["telegram_id"],
+            user1_name=user1["first_name"],
+            user2_id=user2["telegram_id"],
+            user2_name=user2["first_name"],
+            congratulations=tuple(
+                CongratRecord(
+                    id=0,
+                    sender_name=user["first_name"],
+                    message=congrat["message"],
+                    photo_file_id=congrat.get("photo_file_id"),
+                )
+                for user in (user1, user2)
+                for congrat in user["congratulations"]
+            ),
+        )
+
+
+@dataclass(frozen=True, slots=True)
+class DeliveryItem:
+    """
+    Элемент очереди отправки: одно или несколько (при склейке) поздравлений
+    и получатели с id их доставок в outbox, в порядке congratulations
+    """
+
+    congratulations: Tuple[CongratRecord, ...]
+    recipients: Tuple[Tuple[Tuple[int, ...], int], ...]  # ((delivery_id, ...), telegram_id)
+
+    @property
+    def recipient_ids(self) -> Tuple[int, ...]:
+        return tuple(recipient_id for _, recipient_id in self.recipients)
@@ -1,9 +1,16 @@
-from datetime import datetime
+from datetime import datetime, timedelta
+from typing import AsyncIterator, Sequence
 
-from sqlalchemy import delete, select, update
+from sqlalchemy import (ARRAY, BigInteger, Float, and_, bindparam, case, delete,
+                        exists, func, literal, or_, select, update)
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
 
-from .models import Congratulation, Event, User
+from .cache import user_cache
+from .models import (Broadcast, BroadcastStatus, Congratulation, Delivery,
+                     DeliveryStatus, Event, Pair, User)
+from .records import CongratRecord, PairRecord
 from .database import async_session
 
 
@@ -11,15 +18,33 @@ class UserRepository:
     def __init__(self, session: AsyncSession):
         self.session = session
 
+    async def _attach(self, user: User) -> User:
+        """Присоединить закэшированного пользователя к сессии без запроса в базу"""
+        return await self.session.merge(user, load=False)
+
     async def get_user(self, telegram_id: int) -> User | None:
+        cached = user_cache.get(telegram_id)
+        if cached is not None:
+            return await self._attach(cached)
+
         stmt = select(User).where(User.telegram_id == telegram_id)
         result = await self.session.execute(stmt)
-        return result.scalar_one_or_none()
+        user = result.scalar_one_or_none()
+        if user:
+            user_cache.put(user)
+        return user
 
     async def get_user_by_id(self, user_id: int) -> User | None:  # Добавлено
+        cached = user_cache.get_by_id(user_id)
+        if cached is not None:
+            return await self._attach(cached)
+
         stmt = select(User).where(User.id == user_id)
         result = await self.session.execute(stmt)
-        return result.scalar_one_or_none()
+        user = result.scalar_one_or_none()
+        if user:
+            user_cache.put(user)
+        return user
 
     async def create_user(
         self,
@@ -37,8 +62,19 @@ class UserRepository:
         self.session.add(user)
         await self.session.commit()
         await self.session.refresh(user)
+        user_cache.invalidate(telegram_id)
         return user
 
+    async def unblock_user(self, telegram_id: int) -> None:
+        """Пользователь снова написал боту: возвращаем его в рассылки"""
+        await self.session.execute(
+            update(User)
+            .where(User.telegram_id == telegram_id, User.is_blocked.is_(True))
+            .values(is_blocked=False)
+        )
+        await self.session.commit()
+        user_cache.invalidate(telegram_id)
+
     async def set_partner(self, user_id: int, partner_telegram_id: int) -> bool:
         partner = await self.get_user(partner_telegram_id)
         if not partner:
@@ -48,14 +84,65 @@ class UserRepository:
         if user:
             user.partner_id = partner.id
             await self.session.commit()
+            user_cache.invalidate(user_id)
             return True
         return False
 
+    async def create_pair(self, telegram_id: int, partner_telegram_id: int) -> bool:
+        """
+        Связать двух пользователей в пару атомарно:
+        оба partner_id и строка pairs сохраняются одним коммитом.
+        Прежние пары обоих пользователей удаляются.
+        """
+        if telegram_id == partner_telegram_id:
+            return False
+
+        stmt = select(User).where(User.telegram_id.in_([telegram_id, partner_telegram_id]))
+        users = list((await self.session.execute(stmt)).scalars().all())
+        if len(users) != 2:
+            return False
+
+        user_low, user_high = sorted(users, key=lambda u: u.id)
+        user_low.partner_id = user_high.id
+        user_high.partner_id = user_low.id
+
+        ids = [user_low.id, user_high.id]
+        await self.session.execute(
+            delete(Pair).where(
+                or_(Pair.user_low_id.in_(ids), Pair.user_high_id.in_(ids))
+            )
+        )
+        self.session.add(Pair(user_low_id=user_low.id, user_high_id=user_high.id))
+        await self.session.commit()
+        user_cache.invalidate(telegram_id, partner_telegram_id)
+        return True
+
     async def get_partner(self, telegram_id: int) -> User | None:
-        user = await self.get_user(telegram_id)
-        if user and user.partner_id:
-            return await self.get_user_by_id(user.partner_id)
-        return None
+        """
+        Партнер пользователя: из кэша, если там есть оба партнера,
+        иначе одним запросом по индексам таблицы pairs
+        """
+        user = user_cache.get(telegram_id)
+        if user is not None:
+            # create_pair всегда проставляет partner_id обоим партнерам
+            if not user.partner_id:
+                return None
+            partner = user_cache.get_by_id(user.partner_id)
+            if partner is not None and partner.partner_id == user.id:
+                return await self._attach(partner)
+
+        me = aliased(User)
+        stmt = (
+            select(User)
+            .join(Pair, or_(Pair.user_low_id == User.id, Pair.user_high_id == User.id))
+            .join(me, or_(Pair.user_low_id == me.id, Pair.user_high_id == me.id))
+            .where(me.telegram_id == telegram_id, User.id != me.id)
+        )
+        result = await self.session.execute(stmt)
+        partner = result.scalar_one_or_none()
+        if partner:
+            user_cache.put(partner)
+        return partner
 
 
 class EventRepository:
@@ -133,93 +220,546 @@ class CongratulationRepository:
 async def get_all_chat_ids() -> list[int]:
     """Вернуть все telegram_id пользователей для рассылки."""
     async with async_session() as session:
-        result = await session.execute(select(User.telegram_id))
+        result = await session.execute(
+            select(User.telegram_id).where(User.is_blocked.is_(False))
+        )
         # scalars() возвращает генератор, превращаем в список
         return list(result.scalars().all())
 
 
-async def remove_chat_id(chat_id: int) -> None:
+async def get_chat_ids_after(after_user_id: int, limit: int) -> list[tuple[int, int]]:
     """
-    Удалить пользователя из рассылки.
-    Если есть внешние связи, просто пропускаем ошибку, чтобы не падать при рассылке.
+    Следующая пачка получателей рассылки: (users.id, telegram_id) с id > after_user_id.
+    Keyset-пагинация по первичному ключу, без OFFSET.
     """
     async with async_session() as session:
-        try:
-            await session.execute(delete(User).where(User.telegram_id == chat_id))
-            await session.commit()
-        except Exception:
-            # Не ломаем поток уведомлений, логирование можно добавить позже
-            await session.rollback()
+        stmt = (
+            select(User.id, User.telegram_id)
+            .where(User.id > after_user_id, User.is_blocked.is_(False))
+            .order_by(User.id)
+            .limit(limit)
+        )
+        result = await session.execute(stmt)
+        return [(row.id, row.telegram_id) for row in result]
 
 
-async def get_all_partner_pairs() -> list[dict]:
+async def create_broadcast(text: str, lease: timedelta) -> Broadcast:
+    """
+    Создать рассылку, total - число получателей на момент старта.
+    Рассылка сразу арендована создавшим ее процессом
+    """
+    async with async_session() as session:
+        total = await session.scalar(
+            select(func.count()).select_from(User).where(User.is_blocked.is_(False))
+        )
+        broadcast = Broadcast(
+            text=text, total=total or 0, lease_until=datetime.now().astimezone() + lease
+        )
+        session.add(broadcast)
+        await session.commit()
+        return broadcast
+
+
+async def get_broadcast(broadcast_id: int) -> Broadcast | None:
+    async with async_session() as session:
+        return await session.get(Broadcast, broadcast_id)
+
+
+async def get_last_broadcast() -> Broadcast | None:
+    async with async_session() as session:
+        stmt = select(Broadcast).order_by(Broadcast.id.desc()).limit(1)
+        return await session.scalar(stmt)
+
+
+async def get_running_broadcasts() -> list[Broadcast]:
+    """
+    Незавершенные рассылки без живой аренды: процесс, который их вел,
+    перезапущен или упал
+    """
+    async with async_session() as session:
+        stmt = select(Broadcast).where(
+            Broadcast.status == BroadcastStatus.RUNNING,
+            or_(
+                Broadcast.lease_until.is_(None),
+                Broadcast.lease_until < datetime.now().astimezone(),
+            ),
+        )
+        result = await session.execute(stmt)
+        return list(result.scalars().all())
+
+
+async def claim_broadcast(broadcast_id: int, lease: timedelta) -> bool:
+    """
+    Арендовать незавершенную рассылку, если ее никто не ведет.
+    Условие проверяется в самом UPDATE, поэтому из нескольких процессов
+    рассылку получает только один
+    """
+    now = datetime.now().astimezone()
+    async with async_session() as session:
+        result = await session.execute(
+            update(Broadcast)
+            .where(
+                Broadcast.id == broadcast_id,
+                Broadcast.status == BroadcastStatus.RUNNING,
+                or_(Broadcast.lease_until.is_(None), Broadcast.lease_until < now),
+            )
+            .values(lease_until=now + lease)
+        )
+        await session.commit()
+        return result.rowcount == 1
+
+
+async def extend_broadcast_lease(broadcast_id: int, lease: timedelta) -> None:
+    """Продлить аренду идущей рассылки, пока отправляется пачка"""
+    async with async_session() as session:
+        await session.execute(
+            update(Broadcast)
+            .where(Broadcast.id == broadcast_id, Broadcast.status == BroadcastStatus.RUNNING)
+            .values(lease_until=datetime.now().astimezone() + lease)
+        )
+        await session.commit()
+
+
+async def checkpoint_broadcast(
+    broadcast_id: int,
+    last_user_id: int,
+    sent: int,
+    failed: int,
+    status: str | None = None,
+    lease: timedelta | None = None,
+) -> None:
+    """Сохранить прогресс рассылки: обработанная пачка и счетчики; lease продлевает аренду"""
+    values = {
+        "last_user_id": last_user_id,
+        "sent_count": Broadcast.sent_count + sent,
+        "failed_count": Broadcast.failed_count + failed,
+    }
+    if lease is not None:
+        values["lease_until"] = datetime.now().astimezone() + lease
+    if status is not None:
+        values["status"] = status
+        if status != BroadcastStatus.RUNNING:
+            values["finished_at"] = datetime.now().astimezone()
+    async with async_session() as session:
+        await session.execute(
+            update(Broadcast).where(Broadcast.id == broadcast_id).values(**values)
+        )
+        await session.commit()
+
+
+async def mark_chats_blocked(chat_ids: list[int]) -> int:
+    """
+    Пометить пользователей, до которых больше нельзя достучаться (бот заблокирован,
+    чат не найден). Одним запросом на всю пачку; строки не удаляются,
+    чтобы сохранить пары и поздравления.
+    """
+    if not chat_ids:
+        return 0
+    async with async_session() as session:
+        result = await session.execute(
+            update(User)
+            .where(User.telegram_id.in_(chat_ids), User.is_blocked.is_(False))
+            .values(is_blocked=True)
+        )
+        await session.commit()
+    user_cache.invalidate(*chat_ids)
+    return result.rowcount
+
+
+async def get_all_partner_pairs(
+    unplanned_only: bool = False, batch_size: int = 1000
+) -> AsyncIterator[PairRecord]:
     """
     Получить все пары партнеров с их поздравлениями.
-    Возвращает список словарей с информацией о паре и поздравлениях.
+    Асинхронно отдает PairRecord по мере чтения.
     Учитывает только взаимные пары (когда оба пользователя выбрали друг друга).
+    При unplanned_only=True возвращает только поздравления, которых еще нет в outbox,
+    и пропускает пары без таких поздравлений.
+
+    Все делается одним запросом: просмотр таблицы pairs с присоединенными
+    пользователями и поздравлениями обоих партнеров, строки читаются потоком.
     """
+    user1 = aliased(User)
+    user2 = aliased(User)
+
+    congrat_condition = or_(
+        Congratulation.sender_id == user1.id, Congratulation.sender_id == user2.id
+    )
+    if unplanned_only:
+        congrat_condition = and_(
+            congrat_condition,
+            ~exists().where(Delivery.congratulation_id == Congratulation.id),
+        )
+
+    stmt = (
+        select(
+            user1.id,
+            user1.telegram_id,
+            user1.first_name,
+            user2.telegram_id,
+            user2.first_name,
+            Congratulation.id,
+            Congratulation.sender_id,
+            Congratulation.message,
+            Congratulation.photo_file_id,
+        )
+        .select_from(Pair)
+        .join(user1, user1.id == Pair.user_low_id)
+        .join(user2, user2.id == Pair.user_high_id)
+        .join(Congratulation, congrat_condition, isouter=not unplanned_only)
+        .order_by(Pair.user_low_id, Congratulation.id)
+        .execution_options(yield_per=batch_size)
+    )
+
     async with async_session() as session:
-        # Получаем всех пользователей с партнерами
-        stmt = select(User).where(User.partner_id.isnot(None))
-        result = await session.execute(stmt)
-        users = result.scalars().all()
-        
-        pairs = []
-        processed_pairs = set()  # Чтобы не дублировать пары
-        
-        for user in users:
-            if user.id in processed_pairs:
-                continue
-                
-            partner = await session.get(User, user.partner_id)
-            if not partner:
-                continue
-            
-            # Проверяем, что партнер тоже выбрал этого пользователя (взаимная пара)
-            if partner.partner_id != user.id:
+        result = await session.stream(stmt)
+
+        pair = None  # (user1_id, user1_name, user2_id, user2_name) текущей пары
+        congratulations: list[CongratRecord] = []
+        current_id = None
+        async for (
+            user1_id, user1_tg, user1_name, user2_tg, user2_name,
+            congrat_id, sender_id, message, photo_file_id,
+        ) in result:
+            if user1_id != current_id:
+                if pair is not None:
+                    yield PairRecord(*pair, tuple(congratulations))
+                current_id = user1_id
+                pair = (user1_tg, user1_name, user2_tg, user2_name)
+                congratulations = []
+
+            # Пара без поздравлений дает одну строку с пустыми полями поздравления
+            if congrat_id is None:
                 continue
-            
-            # Получаем поздравления от пользователя к партнеру
-            user_congrats_stmt = select(Congratulation).where(
-                Congratulation.sender_id == user.id
+            congratulations.append(CongratRecord(
+                id=congrat_id,
+                sender_name=user1_name if sender_id == user1_id else user2_name,
+                message=message,
+                photo_file_id=photo_file_id,
+            ))
+
+        if pair is not None:
+            yield PairRecord(*pair, tuple(congratulations))
+
+
+async def get_pairs_by_congratulation_ids(
+    congratulation_ids: Sequence[int],
+) -> list[PairRecord]:
+    """
+    Пары партнеров с поздравлениями из списка id, одним запросом.
+    В каждую пару попадают только поздравления из списка,
+    поздравления отправителей без пары пропускаются.
+    """
+    if not congratulation_ids:
+        return []
+    user1 = aliased(User)
+    user2 = aliased(User)
+    stmt = (
+        select(
+            user1.id,
+            user1.telegram_id,
+            user1.first_name,
+            user2.telegram_id,
+            user2.first_name,
+            Congratulation.id,
+            Congratulation.sender_id,
+            Congratulation.message,
+            Congratulation.photo_file_id,
+        )
+        .select_from(Congratulation)
+        .join(
+            Pair,
+            or_(
+                Pair.user_low_id == Congratulation.sender_id,
+                Pair.user_high_id == Congratulation.sender_id,
+            ),
+        )
+        .join(user1, user1.id == Pair.user_low_id)
+        .join(user2, user2.id == Pair.user_high_id)
+        .where(Congratulation.id.in_([int(i) for i in congratulation_ids]))
+        .order_by(Pair.user_low_id, Congratulation.id)
+    )
+
+    async with async_session() as session:
+        result = await session.execute(stmt)
+
+    pairs: dict[int, tuple[tuple, list[CongratRecord]]] = {}
+    for (
+        user1_id, user1_tg, user1_name, user2_tg, user2_name,
+        congrat_id, sender_id, message, photo_file_id,
+    ) in result:
+        _, congratulations = pairs.setdefault(
+            user1_id, ((user1_tg, user1_name, user2_tg, user2_name), [])
+        )
+        congratulations.append(CongratRecord(
+            id=congrat_id,
+            sender_name=user1_name if sender_id == user1_id else user2_name,
+            message=message,
+            photo_file_id=photo_file_id,
+        ))
+    return [
+        PairRecord(*pair, tuple(congratulations))
+        for pair, congratulations in pairs.values()
+    ]
+
+
+async def get_max_congratulation_id(created_before: datetime | None = None) -> int:
+    """
+    Наибольший id поздравления (0, если поздравлений нет) - водяная отметка плана.
+    created_before отсекает недавние поздравления: id выдаются до коммита,
+    и поздравление с меньшим id может появиться в базе позже соседнего
+    """
+    stmt = select(func.max(Congratulation.id))
+    if created_before is not None:
+        stmt = stmt.where(Congratulation.created_at < created_before)
+    async with async_session() as session:
+        result = await session.execute(stmt)
+        return result.scalar() or 0
+
+
+async def get_congratulations_after(
+    after_id: int, limit: int
+) -> list[tuple[int, int | None, int | None]]:
+    """
+    Еще не запланированные поздравления с id больше after_id по возрастанию id:
+    (id поздравления, telegram_id первого партнера, telegram_id второго партнера).
+    Если у отправителя нет пары, вместо telegram_id партнеров - None.
+    """
+    user1 = aliased(User)
+    user2 = aliased(User)
+    stmt = (
+        select(Congratulation.id, user1.telegram_id, user2.telegram_id)
+        .outerjoin(
+            Pair,
+            or_(
+                Pair.user_low_id == Congratulation.sender_id,
+                Pair.user_high_id == Congratulation.sender_id,
+            ),
+        )
+        .outerjoin(user1, user1.id == Pair.user_low_id)
+        .outerjoin(user2, user2.id == Pair.user_high_id)
+        .where(
+            Congratulation.id > after_id,
+            ~exists().where(Delivery.congratulation_id == Congratulation.id),
+        )
+        .order_by(Congratulation.id)
+        .limit(limit)
+    )
+    async with async_session() as session:
+        result = await session.execute(stmt)
+        return [tuple(row) for row in result.all()]
+
+
+# ===== Outbox доставок =====
+async def get_planned_load(since: datetime) -> dict[int, int]:
+    """
+    Сколько доставок ждет отправки в каждую минуту начиная с since:
+    начало минуты в epoch-секундах -> число доставок
+    """
+    minute = (func.floor(func.extract("epoch", Delivery.send_at) / 60) * 60).label("minute")
+    stmt = (
+        select(minute, func.count())
+        .where(
+            Delivery.status == DeliveryStatus.PENDING,
+            Delivery.send_at >= since,
+        )
+        .group_by(minute)
+    )
+    async with async_session() as session:
+        result = await session.execute(stmt)
+        return {int(slot): count for slot, count in result}
+
+
+async def create_deliveries(
+    congratulation_ids: Sequence[int],
+    recipient_ids: Sequence[int],
+    send_at: Sequence[float],
+) -> None:
+    """
+    Сохранить запланированные доставки.
+    Параллельные массивы: id поздравления, telegram_id получателя и время
+    отправки в epoch-секундах. Вставка одним INSERT ... SELECT FROM unnest(...).
+    Уже существующие пары (поздравление, получатель) пропускаются.
+    """
+    if not len(congratulation_ids):
+        return
+    planned = func.unnest(
+        bindparam("congratulation_ids", [int(i) for i in congratulation_ids], ARRAY(BigInteger)),
+        bindparam("recipient_ids", [int(i) for i in recipient_ids], ARRAY(BigInteger)),
+        bindparam("send_at", [float(t) for t in send_at], ARRAY(Float)),
+    ).table_valued("congratulation_id", "recipient_id", "send_at").render_derived()
+
+    async with async_session() as session:
+        stmt = insert(Delivery).from_select(
+            ["congratulation_id", "recipient_id", "send_at", "status", "attempts"],
+            select(
+                planned.c.congratulation_id,
+                planned.c.recipient_id,
+                func.to_timestamp(planned.c.send_at),
+                literal(DeliveryStatus.PENDING),
+                literal(0),
+            ),
+        ).on_conflict_do_nothing(
+            index_elements=[Delivery.congratulation_id, Delivery.recipient_id]
+        )
+        await session.execute(stmt)
+        await session.commit()
+
+
+async def reset_queued_deliveries(lease: timedelta = timedelta(minutes=10)) -> int:
+    """
+    Вернуть в ожидание доставки, загруженные в очередь до перезапуска.
+    Трогаем только доставки с истекшей арендой: свежие в queued сейчас
+    отправляют другие процессы (delivery_worker).
+    """
+    now = datetime.now().astimezone()
+    async with async_session() as session:
+        result = await session.execute(
+            update(Delivery)
+            .where(
+                Delivery.status == DeliveryStatus.QUEUED,
+                or_(Delivery.claimed_at.is_(None), Delivery.claimed_at < now - lease),
+            )
+            .values(status=DeliveryStatus.PENDING, claimed_at=None)
+        )
+        await session.commit()
+        return result.rowcount
+
+
+async def claim_due_deliveries(
+    until: datetime, limit: int, lease: timedelta = timedelta(minutes=10)
+) -> list[dict]:
+    """
+    Забрать пачку неотправленных доставок, время которых наступило (send_at <= until).
+    Выбранные строки помечаются как queued, чтобы не попасть в следующую пачку.
+    Строки блокируются FOR UPDATE SKIP LOCKED: несколько процессов забирают
+    пачки одновременно, и каждая доставка достается только одному из них.
+    Доставки, которые висят в queued дольше lease (процесс упал), забираются снова.
+    Доставки заблокировавшим бота получателям сразу помечаются как failed
+    и не возвращаются.
+    В каждой строке claimed_at - метка аренды: ее продлевает renew_delivery_claims,
+    по ней complete_delivery проверяет, что доставка все еще наша.
+    """
+    now = datetime.now().astimezone()
+    recipient = aliased(User)
+    async with async_session() as session:
+        stmt = (
+            select(
+                Delivery.id,
+                Delivery.congratulation_id,
+                Delivery.recipient_id,
+                Delivery.send_at,
+                Congratulation.message,
+                Congratulation.photo_file_id,
+                User.first_name,
+                recipient.is_blocked,
             )
-            user_congrats_result = await session.execute(user_congrats_stmt)
-            user_congrats = list(user_congrats_result.scalars().all())
-            
-            # Получаем поздравления от партнера к пользователю
-            partner_congrats_stmt = select(Congratulation).where(
-                Congratulation.sender_id == partner.id
+            .join(Congratulation, Congratulation.id == Delivery.congratulation_id)
+            .join(User, User.id == Congratulation.sender_id)
+            .outerjoin(recipient, recipient.telegram_id == Delivery.recipient_id)
+            .where(
+                or_(
+                    and_(
+                        Delivery.status == DeliveryStatus.PENDING,
+                        Delivery.send_at <= until,
+                    ),
+                    and_(
+                        Delivery.status == DeliveryStatus.QUEUED,
+                        Delivery.claimed_at < now - lease,
+                    ),
+                )
             )
-            partner_congrats_result = await session.execute(partner_congrats_stmt)
-            partner_congrats = list(partner_congrats_result.scalars().all())
-            
-            pairs.append({
-                "user1": {
-                    "telegram_id": user.telegram_id,
-                    "first_name": user.first_name,
-                    "congratulations": [
-                        {
-                            "message": c.message,
-                            "photo_file_id": c.photo_file_id
-                        }
-                        for c in user_congrats
-                    ]
-                },
-                "user2": {
-                    "telegram_id": partner.telegram_id,
-                    "first_name": partner.first_name,
-                    "congratulations": [
-                        {
-                            "message": c.message,
-                            "photo_file_id": c.photo_file_id
-                        }
-                        for c in partner_congrats
-                    ]
-                }
-            })
-            
-            # Помечаем обе стороны пары как обработанные
-            processed_pairs.add(user.id)
-            processed_pairs.add(partner.id)
-        
-        return pairs
\ No newline at end of file
+            .order_by(Delivery.send_at, Delivery.id)
+            .limit(limit)
+            .with_for_update(of=Delivery, skip_locked=True)
+        )
+        rows, blocked_ids = [], []
+        for row in await session.execute(stmt):
+            row = dict(row._mapping)
+            if row.pop("is_blocked"):
+                blocked_ids.append(row["id"])
+            else:
+                row["claimed_at"] = now
+                rows.append(row)
+
+        if rows:
+            await session.execute(
+                update(Delivery)
+                .where(Delivery.id.in_([row["id"] for row in rows]))
+                .values(status=DeliveryStatus.QUEUED, claimed_at=now)
+            )
+        if blocked_ids:
+            await session.execute(
+                update(Delivery)
+                .where(Delivery.id.in_(blocked_ids))
+                .values(status=DeliveryStatus.FAILED, last_error="recipient blocked")
+            )
+        if rows or blocked_ids:
+            await session.commit()
+        return rows
+
+
+async def renew_delivery_claims(
+    delivery_ids: Sequence[int], claimed_at: datetime, renewed_at: datetime
+) -> list[int]:
+    """
+    Продлить аренду забранных доставок: claimed_at -> renewed_at.
+    Продлеваются только доставки, которые все еще в queued с нашей меткой;
+    возвращает их id. Остальные уже забрал другой процесс или сбросил перезапуск
+    """
+    async with async_session() as session:
+        result = await session.execute(
+            update(Delivery)
+            .where(
+                Delivery.id.in_(delivery_ids),
+                Delivery.status == DeliveryStatus.QUEUED,
+                Delivery.claimed_at == claimed_at,
+            )
+            .values(claimed_at=renewed_at)
+            .returning(Delivery.id)
+        )
+        await session.commit()
+        return list(result.scalars().all())
+
+
+async def complete_delivery(
+    delivery_id: int,
+    error: str | None = None,
+    max_attempts: int = 3,
+    retry_delay: timedelta = timedelta(minutes=1),
+    message_id: int | None = None,
+    claimed_at: datetime | None = None,
+) -> bool:
+    """
+    Отметить результат доставки.
+    При ошибке доставка возвращается в ожидание, пока не исчерпаны попытки.
+    С claimed_at результат записывается, только если доставка все еще
+    арендована с этой меткой. Возвращает, записан ли результат
+    """
+    async with async_session() as session:
+        if error is None:
+            values = {
+                "status": DeliveryStatus.SENT,
+                "sent_at": datetime.now().astimezone(),
+                "message_id": message_id,
+                "attempts": Delivery.attempts + 1,
+            }
+        else:
+            values = {
+                "status": case(
+                    (Delivery.attempts + 1 >= max_attempts, DeliveryStatus.FAILED),
+                    else_=DeliveryStatus.PENDING,
+                ),
+                "send_at": datetime.now().astimezone() + retry_delay,
+                "attempts": Delivery.attempts + 1,
+                "last_error": error[:1000],
+            }
+        stmt = update(Delivery).where(Delivery.id == delivery_id)
+        if claimed_at is not None:
+            stmt = stmt.where(
+                Delivery.status == DeliveryStatus.QUEUED, Delivery.claimed_at == claimed_at
+            )
+        result = await session.execute(stmt.values(**values))
+        await session.commit()
+        return result.rowcount == 1
+
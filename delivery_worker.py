@@ -0,0 +1,58 @@
+"""
+Процесс отправки поздравлений из outbox (таблица deliveries).
+
+Запуск: python delivery_worker.py. Процессов может быть несколько: каждый
+забирает пачки наступивших доставок через SELECT ... FOR UPDATE SKIP LOCKED,
+поэтому доставка достается только одному из них. Бот при этом запускается
+с SCHEDULER_EXTERNAL_WORKERS=true и только планирует.
+
+Лимитер отправки у каждого процесса свой: TG_GLOBAL_RATE всех воркеров
+в сумме не должен превышать лимит бота.
+"""
+import asyncio
+import logging
+
+from aiogram import Bot
+from aiogram.client.default import DefaultBotProperties
+from aiogram.enums import ParseMode
+
+from config.config import Config, load_config
+from middleware.throttling import setup_rate_limit
+from newyear_sheduler import NewYearScheduler
+from services.dead_chats import dead_chats
+
+logger = logging.getLogger(__name__)
+
+
+async def main():
+    config: Config = load_config()
+
+    logging.basicConfig(
+        level=logging.getLevelName(level=config.log.level),
+        format=config.log.format,
+    )
+
+    bot = Bot(
+        token=config.bot.token,
+        default=DefaultBotProperties(parse_mode=ParseMode.HTML),
+    )
+    setup_rate_limit(bot)
+
+    worker = NewYearScheduler(
+        bot=bot,
+        coalesce_window=config.scheduler.coalesce_window,
+        claim_lease=config.scheduler.claim_lease,
+    )
+    # Миграции применяет бот; доставки других воркеров в queued не трогаем
+    await worker.start(reset_queued=False)
+    logger.info("Воркер отправки запущен")
+
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await worker.cleanup()
+        await dead_chats.cleanup()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -7,7 +7,7 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from database.repository import CongratulationRepository
 from middleware.congratulations import UserCheckMiddleware
 from database.models import User
-from sqlalchemy import select
+from newyear_sheduler import scheduler
 
 congratulation_router = Router()
 congratulation_router.message.middleware(UserCheckMiddleware())
@@ -52,9 +52,9 @@ async def process_congratulation_message(
 
 @congratulation_router.message(CongratulationStates.waiting_for_photo, Command("skip"))
 async def skip_congratulation_photo(
-    message: types.Message, state: FSMContext, session: AsyncSession
+    message: types.Message, state: FSMContext, session: AsyncSession, db_user: User
 ):
-    """Самый простой вариант без middleware"""
+    """Сохраняем поздравление без фото"""
     # 1. Получаем текст
     data = await state.get_data()
     congrat_text = data.get("message", "")
@@ -64,25 +64,18 @@ async def skip_congratulation_photo(
         await state.clear()
         return
 
-    # 2. Находим пользователя ПРОСТЫМ ЗАПРОСОМ
-
-    stmt = select(User).where(User.telegram_id == message.from_user.id)
-    result = await session.execute(stmt)
-    user = result.scalar_one_or_none()
-
-    if not user:
-        await message.answer("❌ Сначала /start")
-        await state.clear()
-        return
+    # 2. Пользователя уже загрузил UserCheckMiddleware
 
     # 3. Сохраняем
     from database.models import Congratulation
 
     congrat = Congratulation(
-        sender_id=user.id, message=congrat_text, photo_file_id=None
+        sender_id=db_user.id, message=congrat_text, photo_file_id=None
     )
     session.add(congrat)
     await session.commit()
+    # Если рассылка уже идет, поздравление сразу попадет в план
+    scheduler.notify_new_congratulation()
 
     await message.answer(f"✅ Сохранено: {congrat_text}")
     await state.clear()
@@ -93,6 +86,7 @@ async def process_congratulation_photo(
     message: types.Message,
     state: FSMContext,
     session: AsyncSession,
+    db_user: User,
 ):
     """
     Сохраняем фото и поздравление
@@ -101,12 +95,6 @@ async def process_congratulation_photo(
     data = await state.get_data()
     congrat_text = data.get("message", "")
 
-    # 2. Находим пользователя ПРОСТЫМ ЗАПРОСОМ
-
-    stmt = select(User).where(User.telegram_id == message.from_user.id)
-    result = await session.execute(stmt)
-    user = result.scalar_one_or_none()
-
     if not congrat_text:
         await message.answer("❌ Ошибка: текст поздравления не найден")
         await state.clear()
@@ -119,8 +107,9 @@ async def process_congratulation_photo(
     # Сохраняем в БД
     congrat_repo = CongratulationRepository(session)
     congrat = await congrat_repo.create_congratulation(
-        sender_id=user.id, message=congrat_text, photo_file_id=photo_file_id
+        sender_id=db_user.id, message=congrat_text, photo_file_id=photo_file_id
     )
+    scheduler.notify_new_congratulation()
 
     await message.answer(
         "🎊 Поздравление с фото сохранено!\n\n" f"Ваш текст: {congrat_text}"
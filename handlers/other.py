@@ -1,8 +1,13 @@
 import os
 from aiogram import Router
-from aiogram.filters import Command
+from aiogram.filters import Command, CommandObject
 from aiogram.types import Message
+from database.cache import user_cache
+from database.database import get_pool_stats
 from newyear_sheduler import scheduler
+from services.broadcast import broadcaster
+from services.dead_chats import dead_chats
+from services.rate_limiter import get_rate_limiter
 
 other_router = Router()
 
@@ -44,10 +49,24 @@ async def schedule_info_command(message: Message):
     
     try:
         info = await scheduler.get_schedule_info()
+        planning = (
+            f"⏳ Идет планирование ({info['planning_elapsed']} сек): "
+            f"пар {info['planning_pairs']}, поздравлений "
+            f"{info['planning_congratulations']}, сохранено доставок "
+            f"{info['planning_stored']}\n\n"
+            if info["planning"] else ""
+        )
         text = (
             f"📊 Информация о планировщике:\n\n"
+            f"{planning}"
+            f"Запланировано в outbox: {info['planned_tasks']}\n"
             f"Всего задач: {info['total_tasks']}\n"
             f"Активных задач: {info['active_tasks']}\n"
+            f"Отправлено: {info['sent_tasks']}\n"
+            f"Средняя задержка отправки: {info['avg_latency_ms']} мс\n"
+            f"Пик плана: {info['projected_peak_per_minute']} сообщ/мин "
+            f"из {info['send_capacity_per_minute']}\n"
+            f"Роль реплики: {'лидер' if info['is_leader'] else 'резерв'}\n"
             f"Тестовый режим: {'Да' if info['is_test_mode'] else 'Нет'}\n"
             f"Текущий год: {info['current_year']}"
         )
@@ -56,6 +75,120 @@ async def schedule_info_command(message: Message):
         await message.answer(f"❌ Ошибка при получении информации: {e}")
 
 
+@other_router.message(Command(commands="plan_preview"))
+async def plan_preview_command(message: Message):
+    """Прогноз плана без записи в outbox: пик нагрузки до начала отправки"""
+    if not is_admin(message.from_user.id):
+        await message.answer("❌ Эта команда доступна только администратору")
+        return
+
+    try:
+        plan = await scheduler.schedule_all_congratulations(dry_run=True)
+    except Exception as e:
+        await message.answer(f"❌ Ошибка при построении прогноза: {e}")
+        return
+    if plan is None:
+        await message.answer(
+            "📭 Планировать нечего: кампания не идет или все поздравления уже в плане"
+        )
+        return
+
+    text = (
+        f"🔮 Прогноз для еще не запланированных поздравлений:\n\n"
+        f"Поздравлений: {len(plan.send_times)}\n"
+        f"Пик: {plan.peak_per_minute * 2} сообщ/мин "
+        f"({plan.peak_messages_per_second * 2:.1f} сообщ/сек) "
+        f"из {round(scheduler.send_rate * 60)}\n"
+        f"Последняя отправка: {plan.end:%d.%m.%Y %H:%M}"
+    )
+    if plan.overflow:
+        text += "\n⚠️ Окно кампании не вмещает все поздравления, план выходит за его конец"
+    await message.answer(text)
+
+
+@other_router.message(Command(commands="stats"))
+async def stats_command(message: Message):
+    """Метрики процесса: кэш пользователей, пул соединений БД и лимитер отправки"""
+    if not is_admin(message.from_user.id):
+        await message.answer("❌ Эта команда доступна только администратору")
+        return
+
+    cache = user_cache.stats()
+    pool = get_pool_stats()
+    limits = get_rate_limiter().stats()
+    text = (
+        f"📈 Метрики бота:\n\n"
+        f"Кэш пользователей: {cache['size']}/{cache['maxsize']}\n"
+        f"Попаданий: {cache['hits']}, промахов: {cache['misses']} "
+        f"({cache['hit_rate']:.0%})\n\n"
+        f"Пул БД: занято {pool['in_use']}, свободно {pool['idle']}, "
+        f"размер {pool['size']} (+{pool['overflow']} сверх)\n"
+        f"Ожидание соединения: среднее {pool['avg_wait_ms']} мс, "
+        f"максимум {pool['max_wait_ms']} мс\n"
+        f"Выдано соединений: {pool['checkouts']}, таймаутов: {pool['timeouts']}\n\n"
+        f"Лимит отправки: {limits['current_rate']}/{limits['max_rate']} сообщ/сек\n"
+        f"Отправлено: {limits['sent']}, ответов 429: {limits['floods']}, "
+        f"чатов в лимитере: {limits['chat_buckets']}\n"
+        f"Отмечено заблокировавших бота: {dead_chats.total_blocked}"
+    )
+    await message.answer(text)
+
+
+@other_router.message(Command(commands="broadcast"))
+async def broadcast_command(message: Message, command: CommandObject):
+    """Рассылка сообщения всем пользователям: /broadcast <текст>"""
+    if not is_admin(message.from_user.id):
+        await message.answer("❌ Эта команда доступна только администратору")
+        return
+
+    if not command.args:
+        await message.answer("Использование: /broadcast <текст сообщения>")
+        return
+    if broadcaster.is_running:
+        await message.answer("⏳ Предыдущая рассылка еще идет, см. /broadcast_status")
+        return
+
+    broadcast_id = await broadcaster.start(command.args)
+    await message.answer(f"📣 Рассылка #{broadcast_id} запущена, прогресс: /broadcast_status")
+
+
+@other_router.message(Command(commands="broadcast_stop"))
+async def broadcast_stop_command(message: Message):
+    """Остановить текущую рассылку после отправки текущей пачки"""
+    if not is_admin(message.from_user.id):
+        await message.answer("❌ Эта команда доступна только администратору")
+        return
+
+    status = await broadcaster.get_status()
+    if status and await broadcaster.cancel(status["id"]):
+        await message.answer(f"⏹ Рассылка #{status['id']} будет остановлена")
+    else:
+        await message.answer("Активных рассылок нет")
+
+
+@other_router.message(Command(commands="broadcast_status"))
+async def broadcast_status_command(message: Message):
+    """Прогресс последней рассылки"""
+    if not is_admin(message.from_user.id):
+        await message.answer("❌ Эта команда доступна только администратору")
+        return
+
+    status = await broadcaster.get_status()
+    if status is None:
+        await message.answer("Рассылок еще не было")
+        return
+
+    eta = status["eta_seconds"]
+    text = (
+        f"📣 Рассылка #{status['id']}: {status['status']}\n\n"
+        f"Обработано: {status['sent'] + status['failed']}/{status['total']}\n"
+        f"Доставлено: {status['sent']}, ошибок: {status['failed']}\n"
+        f"Скорость: {status['rate']:.1f} сообщ/сек\n"
+        f"Осталось: {f'~{int(eta // 60)} мин {int(eta % 60)} сек' if eta is not None else '-'}"
+    )
+    await message.answer(text)
+
+
 # Этот хэндлер будет реагировать на любые сообщения пользователя,
 # не предусмотренные логикой работы бота
 @other_router.message()
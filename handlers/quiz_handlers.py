@@ -16,7 +16,6 @@ from sqlalchemy.ext.asyncio import AsyncSession
 
 from database.models import Event, User
 from database.repository import EventRepository, UserRepository
-from database.database import async_session
 
 quiz_router = Router()
 
@@ -204,71 +203,72 @@ async def create_and_send_quiz(
 
 
 @quiz_router.poll_answer()
-async def handle_quiz_answer(poll_answer: PollAnswer, bot: Bot):
+async def handle_quiz_answer(
+    poll_answer: PollAnswer, bot: Bot, session: AsyncSession
+):
     """
     Обработчик ответов на викторину
     """
-    async with async_session() as session:
-        # 1. Находим событие по ID викторины
-        stmt = select(Event).where(Event.telegram_poll_id == poll_answer.poll_id)
-        result = await session.execute(stmt)
-        event = result.scalar_one_or_none()
-
-        if not event:
-            return
-
-        # 2. Находим пользователей
-        creator_stmt = select(User).where(User.id == event.creator_id)
-        creator_result = await session.execute(creator_stmt)
-        creator = creator_result.scalar_one_or_none()
-
-        if not creator:
-            return
-
-        # 3. Проверяем ответ
-        user_answer = poll_answer.option_ids[0] if poll_answer.option_ids else None
-        is_correct = user_answer == event.correct_option_id
-
-        # 4. Отправляем сообщения
-        if is_correct:
-            await bot.send_message(
-                chat_id=creator.telegram_id,
-                text=f"🎯 {poll_answer.user.first_name} правильно угадал!\n"
-                f"Теперь ты должен создать послание командой /congratulate",
-            )
-
-            # 5. Обновляем статус
-            update_stmt = (
-                update(Event).where(Event.id == event.id).values(is_completed=True)
-            )
-            await session.execute(update_stmt)
-            await session.commit()
-
-            await bot.send_message(
-                chat_id=poll_answer.user.id,
-                text="✅ Правильно! Теперь твой партнер должен создать послание",
-            )
-        else:
-            # Получаем правильный вариант текста
-            correct_option_text = (
-                event.options[event.correct_option_id]
-                if event.options
-                else str(event.correct_option_id)
-            )
-            user_answer_text = (
-                event.options[user_answer]
-                if event.options
-                and user_answer is not None
-                and 0 <= user_answer < len(event.options)
-                else str(user_answer)
-            )
-            await bot.send_message(
-                chat_id=poll_answer.user.id,
-                text=f"❌ Неправильно. Правильный ответ - {correct_option_text}\n"
-                f"Теперь ты должен создать послание командой /congratulate",
-            )
-            await bot.send_message(
-                chat_id=creator.telegram_id,
-                text=f"🎯 {poll_answer.user.first_name} овтетил(а) - {user_answer_text}\n"
-                f"Теперь он(a) создаст послание на будущий год",
-            )
+    # 1. Находим событие по ID викторины
+    stmt = select(Event).where(Event.telegram_poll_id == poll_answer.poll_id)
+    result = await session.execute(stmt)
+    event = result.scalar_one_or_none()
+
+    if not event:
+        return
+
+    # 2. Находим пользователей
+    creator_stmt = select(User).where(User.id == event.creator_id)
+    creator_result = await session.execute(creator_stmt)
+    creator = creator_result.scalar_one_or_none()
+
+    if not creator:
+        return
+
+    # 3. Проверяем ответ
+    user_answer = poll_answer.option_ids[0] if poll_answer.option_ids else None
+    is_correct = user_answer == event.correct_option_id
+
+    # 4. Отправляем сообщения
+    if is_correct:
+        await bot.send_message(
+            chat_id=creator.telegram_id,
+            text=f"🎯 {poll_answer.user.first_name} правильно угадал!\n"
+            f"Теперь ты должен создать послание командой /congratulate",
+        )
+
+        # 5. Обновляем статус
+        update_stmt = (
+            update(Event).where(Event.id == event.id).values(is_completed=True)
+        )
+        await session.execute(update_stmt)
+        await session.commit()
+
+        await bot.send_message(
+            chat_id=poll_answer.user.id,
+            text="✅ Правильно! Теперь твой партнер должен создать послание",
+        )
+    else:
+        # Получаем правильный вариант текста
+        correct_option_text = (
+            event.options[event.correct_option_id]
+            if event.options
+            else str(event.correct_option_id)
+        )
+        user_answer_text = (
+            event.options[user_answer]
+            if event.options
+            and user_answer is not None
+            and 0 <= user_answer < len(event.options)
+            else str(user_answer)
+        )
+        await bot.send_message(
+            chat_id=poll_answer.user.id,
+            text=f"❌ Неправильно. Правильный ответ - {correct_option_text}\n"
+            f"Теперь ты должен создать послание командой /congratulate",
+        )
+        await bot.send_message(
+            chat_id=creator.telegram_id,
+            text=f"🎯 {poll_answer.user.first_name} овтетил(а) - {user_answer_text}\n"
+            f"Теперь он(a) создаст послание на будущий год",
+        )
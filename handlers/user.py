@@ -5,6 +5,7 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from database.repository import UserRepository, CongratulationRepository
 from keyboards.add_patrner import partner_keyboard
 from lexicon.lexicon import LEXICON
+from services.dead_chats import dead_chats
 from datetime import datetime
 
 user_router = Router()
@@ -27,7 +28,11 @@ async def process_start_command(message: Message, session: AsyncSession):
         # Отправляем сообщение о регистрации
         await message.answer("🎉 Вы успешно зарегистрированы!")
     else:
-        # Пользователь уже зарегистрирован
+        # Пользователь уже зарегистрирован; если блокировал бота - возвращаем в рассылки.
+        # is_blocked в кэше может быть устаревшим (блокировку пишут воркеры), поэтому
+        # снимаем ее в базе без проверки
+        await user_repo.unblock_user(message.from_user.id)
+        dead_chats.forget(message.from_user.id)
         await message.answer("👋 С возвращением!")
 
     # 2. Отправляем ТОЛЬКО приветственное сообщение БЕЗ клавиатуры
@@ -65,15 +70,12 @@ async def process_user_shared(message: Message, session: AsyncSession):
 
     user_repo = UserRepository(session)
 
-    # Устанавливаем партнера
-    success = await user_repo.set_partner(
-        user_id=message.from_user.id, partner_telegram_id=message.user_shared.user_id
-    )
-    partner_succes = await user_repo.set_partner(
-        user_id=message.user_shared.user_id, partner_telegram_id=message.from_user.id
+    # Связываем обоих пользователей в пару одной транзакцией
+    success = await user_repo.create_pair(
+        telegram_id=message.from_user.id, partner_telegram_id=message.user_shared.user_id
     )
 
-    if success and partner_succes:
+    if success:
         await message.answer(
             text=f"Отлично! Теперь {message.user_shared.first_name} ваш партнер в этой игре 🎯",
             reply_markup=types.ReplyKeyboardRemove(),
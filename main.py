@@ -1,6 +1,7 @@
 import asyncio
 import logging
 
+from aiohttp import web
 from aiogram import Bot, Dispatcher
 from aiogram.client.default import DefaultBotProperties
 from aiogram.enums import ParseMode
@@ -9,14 +10,18 @@ from aiogram.types import (
     BotCommandScopeDefault,
     BotCommandScopeAllPrivateChats,
 )
-from config.config import Config, load_config
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from config.config import Config, WebhookConfig, load_config
 from database.database import init_db
 from handlers.congratulation_handlers import congratulation_router
 from handlers.other import other_router
 from handlers.user import user_router
 from handlers.quiz_handlers import quiz_router
 from middleware.database import DatabaseMiddleware
-from database.repository import get_all_chat_ids, remove_chat_id
+from middleware.throttling import setup_rate_limit
+from services.broadcast import broadcaster
+from services.dead_chats import dead_chats
+from services.fsm_storage import create_fsm_storage
 
 # Импортируем планировщик
 from newyear_sheduler import init_scheduler, scheduler
@@ -24,17 +29,6 @@ from newyear_sheduler import init_scheduler, scheduler
 logger = logging.getLogger(__name__)
 
 
-async def notify_all(bot: Bot, text: str):
-    "Оповещение всех пользователей об обновлении"
-    for chat_id in await get_all_chat_ids():
-        try:
-            await bot.send_message(chat_id, text)
-            await asyncio.sleep(0.04)  # ~25 msg/сек
-        except Exception as e:
-            if "Forbidden" in str(e) or "403" in str(e):
-                await remove_chat_id(chat_id)
-
-
 async def set_bot_commands(bot: Bot):
     """Устанавливаем команды бота в меню слева от поля ввода"""
     commands = [
@@ -47,6 +41,10 @@ async def set_bot_commands(bot: Bot):
         # Добавляем команду для теста планировщика (только админу)
         BotCommand(command="test_schedule", description="🧪 Тест отправки (admin)"),
         BotCommand(command="schedule_info", description="📊 Инфо о планировщике (admin)"),
+        BotCommand(command="plan_preview", description="🔮 Прогноз плана отправки (admin)"),
+        BotCommand(command="stats", description="📈 Метрики бота (admin)"),
+        BotCommand(command="broadcast", description="📣 Рассылка всем (admin)"),
+        BotCommand(command="broadcast_status", description="📣 Прогресс рассылки (admin)"),
     ]
     logger.info(f"Setting commands: {commands}")
     try:
@@ -60,6 +58,30 @@ async def set_bot_commands(bot: Bot):
         return False
 
 
+async def run_webhook(bot: Bot, dp: Dispatcher, webhook: WebhookConfig):
+    """Прием апдейтов вебхуком: aiohttp-сервер на webhook.port"""
+    await bot.set_webhook(
+        url=webhook.url.rstrip("/") + webhook.path,
+        secret_token=webhook.secret or None,
+        allowed_updates=dp.resolve_used_update_types(),
+    )
+
+    app = web.Application()
+    SimpleRequestHandler(
+        dispatcher=dp, bot=bot, secret_token=webhook.secret or None
+    ).register(app, path=webhook.path)
+    setup_application(app, dp, bot=bot)
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    try:
+        await web.TCPSite(runner, host=webhook.host, port=webhook.port).start()
+        logger.info(f"🌐 Вебхук слушает {webhook.host}:{webhook.port}{webhook.path}")
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+
+
 async def main():
     config: Config = load_config()
 
@@ -77,13 +99,14 @@ async def main():
         token=config.bot.token,
         default=DefaultBotProperties(parse_mode=ParseMode.HTML),
     )
-    dp = Dispatcher()
+    # Все исходящие вызовы бота проходят через общий лимитер
+    setup_rate_limit(bot)
+    # Состояния диалогов в Redis переживают перезапуск и общие для всех процессов
+    storage = create_fsm_storage(config.redis)
+    dp = Dispatcher(storage=storage)
 
-    # Регистрируем middleware для всех роутеров
-    routers = [user_router, other_router, quiz_router, congratulation_router]
-    for router in routers:
-        router.message.middleware(DatabaseMiddleware())
-        router.callback_query.middleware(DatabaseMiddleware())
+    # Одна outer-middleware на все апдейты: сессия БД открывается лениво
+    dp.update.outer_middleware(DatabaseMiddleware())
 
     # Регистрируем роутеры
     dp.include_router(user_router)  # 1. Основные команды (/start, /help, /partner)
@@ -94,7 +117,7 @@ async def main():
     # ИНИЦИАЛИЗИРУЕМ ПЛАНИРОВЩИК
     logger.info("Инициализация новогоднего планировщика...")
     await init_scheduler(bot)
-    logger.info("Планировщик инициализирован")
+    logger.info("Планировщик инициализирован, план строится в фоне")
 
     # Устанавливаем команды бота
     try:
@@ -103,20 +126,26 @@ async def main():
     except Exception as e:
         logger.warning(f"Could not set bot commands: {e}")
 
-    await bot.delete_webhook(drop_pending_updates=True)
-    
-    # Оповещение всех пользователей об обновлении
-    # await notify_all(
-    #     bot,
-    #     "🎉 Вышло обновление!\nТеперь при неправильном ответе партнера, создателю приходит какой вариант был выбран",
-    # )
-    
-    # Запускаем поллинг
+    # Рассылки запускаются командой /broadcast; прерванные продолжает
+    # ровно один процесс бота - тот, кто первым возьмет аренду
+    broadcaster.bot = bot
+    broadcaster.start_resuming()
+
     logger.info("Бот запущен и готов к работе!")
-    await dp.start_polling(bot)
-    
-    # При завершении работы очищаем ресурсы планировщика
-    await scheduler.cleanup()
+    try:
+        if config.webhook.url:
+            # Реплик может быть несколько: вебхук и накопленные апдейты не сбрасываем
+            await run_webhook(bot, dp, config.webhook)
+        else:
+            # Запускаем поллинг
+            await bot.delete_webhook(drop_pending_updates=True)
+            await dp.start_polling(bot)
+    finally:
+        # При завершении работы очищаем ресурсы планировщика и рассылок
+        await broadcaster.cleanup()
+        await scheduler.cleanup()
+        await dead_chats.cleanup()
+        await storage.close()
 
 
 if __name__ == "__main__":
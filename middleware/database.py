@@ -1,14 +1,47 @@
-from typing import Any, Awaitable, Callable, Dict
+from typing import Any, Awaitable, Callable, Dict, Optional
 
 from aiogram import BaseMiddleware
-from aiogram.types import CallbackQuery, Message
-from database.database import async_session
+from database.database import async_session, session_has_writes
 from sqlalchemy.ext.asyncio import AsyncSession
 
 
+class LazySession:
+    """
+    Прокси AsyncSession: настоящая сессия (и соединение из пула) появляется
+    только при первом обращении к ней из хэндлера
+    """
+
+    __slots__ = ("_session",)
+
+    def __init__(self):
+        self._session: Optional[AsyncSession] = None
+
+    @property
+    def is_started(self) -> bool:
+        return self._session is not None
+
+    def __getattr__(self, name: str) -> Any:
+        if self._session is None:
+            self._session = async_session()
+        return getattr(self._session, name)
+
+    async def finish(self, failed: bool = False) -> None:
+        """Коммит только если сессия что-то изменила, затем возврат соединения в пул"""
+        session = self._session
+        if session is None:
+            return
+        try:
+            if failed:
+                await session.rollback()
+            elif session.in_transaction() and session_has_writes(session):
+                await session.commit()
+        finally:
+            await session.close()
+
+
 class DatabaseMiddleware(BaseMiddleware):
     """
-    Middleware для внедрения сессии БД в хэндлеры
+    Outer-middleware диспетчера: внедряет ленивую сессию БД в хэндлеры
     """
 
     async def __call__(
@@ -17,21 +50,16 @@ class DatabaseMiddleware(BaseMiddleware):
         event: Any,  # Любой тип события
         data: Dict[str, Any],
     ) -> Any:
-        # Создаем новую сессию для каждого запроса
-        async with async_session() as session:
-            # Добавляем сессию в data (будет доступна в хэндлере)
-            data["session"] = session
-
-            try:
-                # Вызываем хэндлер
-                result = await handler(event, data)
-                # Коммитим изменения
-                await session.commit()
-                return result
-            except Exception as e:
-                # Откатываем в случае ошибки
-                await session.rollback()
-                raise
-            finally:
-                # Закрываем сессию
-                await session.close()
+        session = LazySession()
+        # Добавляем сессию в data (будет доступна в хэндлере)
+        data["session"] = session
+
+        try:
+            # Вызываем хэндлер
+            result = await handler(event, data)
+        except Exception:
+            # Откатываем в случае ошибки
+            await session.finish(failed=True)
+            raise
+        await session.finish()
+        return result
@@ -0,0 +1,62 @@
+import logging
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import (BaseRequestMiddleware,
+                                                     NextRequestMiddlewareType)
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import Response, TelegramMethod
+from aiogram.methods.base import TelegramType
+
+from services.rate_limiter import RateLimiter, get_rate_limiter
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimitMiddleware(BaseRequestMiddleware):
+    """
+    Middleware сессии бота: все исходящие сообщения проходят через общий лимитер.
+    На 429 (TelegramRetryAfter) чат приостанавливается на retry_after,
+    лимитер снижает скорость, а запрос повторяется после паузы.
+    """
+
+    # Методы, которые отправляют сообщения в чат и подпадают под лимиты Telegram
+    LIMITED_PREFIXES = ("Send", "Forward", "Copy")
+
+    def __init__(self, limiter: RateLimiter | None = None, max_retries: int = 3):
+        self.limiter = limiter or get_rate_limiter()
+        self.max_retries = max_retries
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        if not type(method).__name__.startswith(self.LIMITED_PREFIXES):
+            return await make_request(bot, method)
+
+        chat_id = getattr(method, "chat_id", None)
+        attempt = 0
+        while True:
+            await self.limiter.acquire(chat_id)
+            try:
+                response = await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                self.limiter.on_flood(chat_id, e.retry_after)
+                attempt += 1
+                logger.warning(
+                    f"Flood control для {chat_id}: пауза {e.retry_after} сек, "
+                    f"скорость снижена до {self.limiter.current_rate:.1f}/сек "
+                    f"(попытка {attempt}/{self.max_retries})"
+                )
+                if attempt > self.max_retries:
+                    raise
+                continue
+            self.limiter.on_success()
+            return response
+
+
+def setup_rate_limit(bot: Bot, limiter: RateLimiter | None = None) -> Bot:
+    """Подключить общий лимитер к сессии бота"""
+    bot.session.middleware(RateLimitMiddleware(limiter))
+    return bot
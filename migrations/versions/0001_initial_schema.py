@@ -0,0 +1,76 @@
+"""Исходная схема: users, events, congratulations
+
+Revision ID: 0001
+Revises:
+Create Date: 2025-12-20 12:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0001"
+down_revision: Union[str, Sequence[str], None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "users",
+        sa.Column("id", sa.BigInteger(), primary_key=True),
+        sa.Column("telegram_id", sa.BigInteger(), nullable=False, unique=True),
+        sa.Column("username", sa.String(100)),
+        sa.Column("first_name", sa.String(100), nullable=False),
+        sa.Column("last_name", sa.String(100)),
+        sa.Column("partner_id", sa.BigInteger(), sa.ForeignKey("users.id"), nullable=True),
+        sa.Column(
+            "created_at",
+            sa.DateTime(timezone=True),
+            server_default=sa.func.now(),
+            nullable=False,
+        ),
+    )
+    op.create_table(
+        "events",
+        sa.Column("id", sa.Integer(), primary_key=True, autoincrement=True),
+        sa.Column("creator_id", sa.BigInteger(), sa.ForeignKey("users.id"), nullable=False),
+        sa.Column("partner_id", sa.BigInteger(), sa.ForeignKey("users.id"), nullable=False),
+        sa.Column("photo_file_id", sa.String(500)),
+        sa.Column("question", sa.Text(), nullable=False),
+        sa.Column("options", sa.ARRAY(sa.String(100)), nullable=False),
+        sa.Column("correct_option_id", sa.Integer(), nullable=False),
+        sa.Column(
+            "created_at",
+            sa.DateTime(timezone=True),
+            server_default=sa.func.now(),
+            nullable=False,
+        ),
+        sa.Column("is_completed", sa.Boolean(), nullable=False),
+        sa.Column("explanation", sa.Text()),
+        sa.Column("telegram_poll_id", sa.String(100), unique=True),
+    )
+    op.create_table(
+        "congratulations",
+        sa.Column("id", sa.Integer(), primary_key=True, autoincrement=True),
+        sa.Column("sender_id", sa.BigInteger(), sa.ForeignKey("users.id"), nullable=False),
+        sa.Column("message", sa.Text(), nullable=False),
+        sa.Column("photo_file_id", sa.String(500)),
+        sa.Column(
+            "created_at",
+            sa.DateTime(timezone=True),
+            server_default=sa.func.now(),
+            nullable=False,
+        ),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table("congratulations")
+    op.drop_table("events")
+    op.drop_table("users")
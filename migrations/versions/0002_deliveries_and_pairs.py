@@ -0,0 +1,101 @@
+"""Outbox доставок и таблица пар
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2025-12-27 12:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0002"
+down_revision: Union[str, Sequence[str], None] = "0001"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Базы, созданные через create_all, могут уже содержать эти таблицы
+    existing = sa.inspect(op.get_bind()).get_table_names()
+
+    if "deliveries" not in existing:
+        op.create_table(
+            "deliveries",
+            sa.Column("id", sa.BigInteger(), primary_key=True, autoincrement=True),
+            sa.Column(
+                "congratulation_id",
+                sa.Integer(),
+                sa.ForeignKey("congratulations.id", ondelete="CASCADE"),
+                nullable=False,
+            ),
+            sa.Column("recipient_id", sa.BigInteger(), nullable=False),
+            sa.Column("send_at", sa.DateTime(timezone=True), nullable=False),
+            sa.Column("status", sa.String(20), nullable=False),
+            sa.Column("attempts", sa.Integer(), nullable=False),
+            sa.Column("sent_at", sa.DateTime(timezone=True)),
+            sa.Column("last_error", sa.Text()),
+            sa.Column(
+                "created_at",
+                sa.DateTime(timezone=True),
+                server_default=sa.func.now(),
+                nullable=False,
+            ),
+            sa.UniqueConstraint(
+                "congratulation_id",
+                "recipient_id",
+                name="uq_deliveries_congratulation_recipient",
+            ),
+        )
+        op.create_index(
+            "ix_deliveries_status_send_at", "deliveries", ["status", "send_at"]
+        )
+
+    if "pairs" not in existing:
+        op.create_table(
+            "pairs",
+            sa.Column("id", sa.BigInteger(), primary_key=True, autoincrement=True),
+            sa.Column(
+                "user_low_id",
+                sa.BigInteger(),
+                sa.ForeignKey("users.id", ondelete="CASCADE"),
+                nullable=False,
+            ),
+            sa.Column(
+                "user_high_id",
+                sa.BigInteger(),
+                sa.ForeignKey("users.id", ondelete="CASCADE"),
+                nullable=False,
+            ),
+            sa.Column(
+                "created_at",
+                sa.DateTime(timezone=True),
+                server_default=sa.func.now(),
+                nullable=False,
+            ),
+            sa.UniqueConstraint("user_low_id", "user_high_id", name="uq_pairs_users"),
+            sa.CheckConstraint("user_low_id < user_high_id", name="ck_pairs_order"),
+        )
+        op.create_index("ix_pairs_user_high_id", "pairs", ["user_high_id"])
+
+    # Переносим взаимные пары, выбранные до появления таблицы pairs
+    op.execute(
+        """
+        INSERT INTO pairs (user_low_id, user_high_id)
+        SELECT u1.id, u2.id
+        FROM users u1
+        JOIN users u2 ON u2.id = u1.partner_id AND u2.partner_id = u1.id
+        WHERE u1.id < u2.id
+        ON CONFLICT DO NOTHING
+        """
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table("pairs")
+    op.drop_table("deliveries")
@@ -0,0 +1,39 @@
+"""Индексы по горячим фильтрам
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18 12:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0003"
+down_revision: Union[str, Sequence[str], None] = "0002"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index("ix_users_partner_id", "users", ["partner_id"])
+    op.create_index("ix_events_creator_id", "events", ["creator_id"])
+    op.create_index("ix_events_partner_id", "events", ["partner_id"])
+    # Покрывает и фильтр по sender_id, и сортировку list_by_sender
+    op.create_index(
+        "ix_congratulations_sender_id_created_at",
+        "congratulations",
+        ["sender_id", sa.text("created_at DESC")],
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index("ix_congratulations_sender_id_created_at", table_name="congratulations")
+    op.drop_index("ix_events_partner_id", table_name="events")
+    op.drop_index("ix_events_creator_id", table_name="events")
+    op.drop_index("ix_users_partner_id", table_name="users")
@@ -4,262 +4,873 @@
 в диапазоне от 00:00 01.01.2026 до 23:59:59 13.01.2026
 """
 import asyncio
+import heapq
+import itertools
 import logging
-import random
+import math
+import time
+from dataclasses import dataclass, field
 from datetime import datetime, timedelta
-from typing import Dict, List
+from functools import partial
+from typing import (Awaitable, Callable, Dict, Iterator, List, Optional,
+                    Sequence, Tuple)
 
+import numpy as np
 from aiogram import Bot
 from aiogram.client.default import DefaultBotProperties
 from aiogram.enums import ParseMode
+from aiogram.types import InputMediaPhoto
 
 from config.config import load_config
-from database.repository import get_all_partner_pairs
+from middleware.throttling import setup_rate_limit
+from database.database import LeaderLock
+from database.records import CongratRecord, DeliveryItem
+from database.repository import (claim_due_deliveries, complete_delivery,
+                                 renew_delivery_claims,
+                                 create_deliveries, get_all_partner_pairs,
+                                 get_congratulations_after,
+                                 get_max_congratulation_id, get_planned_load,
+                                 reset_queued_deliveries)
+from services.dead_chats import dead_chats, is_dead_chat_error
+from services.planner import DeliveryPlan, plan_send_times
 
 logger = logging.getLogger(__name__)
 
 
+MEDIA_GROUP_LIMIT = 10  # Фото в одном альбоме
+# Насколько водяная отметка отстает от новейших поздравлений: поздравление
+# с меньшим id может закоммититься позже соседнего
+WATERMARK_LAG = timedelta(minutes=5)
+TEXT_LIMIT = 4096  # Символов в одном сообщении
+
+
+@dataclass
+class DeliveryResult:
+    """Результат отправки поздравления одному получателю"""
+
+    recipient_id: int
+    message_id: Optional[int] = None
+    error: Optional[str] = None
+    dead_chat: bool = False  # Получатель заблокировал бота, повторять бессмысленно
+    latency: float = 0.0  # Время вызова API с учетом ожидания лимитера, сек
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+@dataclass
+class PlanningProgress:
+    """Ход полного планирования: прочитано пар и поздравлений, сохранено доставок"""
+
+    pairs: int = 0
+    congratulations: int = 0
+    stored: int = 0
+    started: float = field(default_factory=time.monotonic)
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+
+
 class NewYearScheduler:
-    """Планировщик новогодних поздравлений"""
+    """
+    Планировщик новогодних поздравлений
+
+    План рассылки хранится в таблице deliveries (outbox), поэтому перезапуск
+    не приводит к повторной отправке. Наступившие доставки подгружаются пачками
+    в кучу по времени отправки, откуда единственный диспетчер передает их
+    ограниченному пулу воркеров.
+
+    Поздравления, созданные после первого плана, дополняют его: обработчики
+    сигналят через notify_new_congratulation, а фоновая задача планирует
+    поздравления с id выше водяной отметки.
 
-    def __init__(self, bot: Bot = None):
+    При нескольких репликах бота планирует и отправляет только лидер,
+    владеющий leader_lock; остальные ждут и подхватывают работу, если лидер пропал.
+    """
+
+    def __init__(
+        self,
+        bot: Bot = None,
+        workers: int = 16,
+        batch_size: int = 500,
+        poll_interval: float = 5.0,
+        coalesce_window: float = 0.0,
+        send_rate: float = 24.0,
+        quiet_hours: Optional[Tuple[int, int]] = None,
+        planning_interval: float = 60.0,
+        claim_lease: float = 600.0,
+    ):
         self.bot = bot
-        self.scheduled_tasks: List[asyncio.Task] = []
         self.is_test_mode = False  # Режим для тестов (игнорирует проверку года)
+        self.workers_count = workers
+        self.batch_size = batch_size  # Размер пачки при чтении outbox
+        self.poll_interval = poll_interval  # Период опроса outbox, сек
+        # Окно склейки, сек: поздравления одной пары, попавшие в окно, уходят
+        # одним альбомом / одним сообщением. 0 - склейка выключена
+        self.coalesce_window = coalesce_window
+        # Аренда забранной доставки, сек: после нее доставка из queued забирается снова
+        self.claim_lease = claim_lease
+        # Доставки отправляют отдельные процессы (delivery_worker.py), здесь только план
+        self.external_workers = False
+        # Потолок плановой отправки, сообщений/сек, и часы, когда не отправляем
+        self.send_rate = send_rate
+        self.quiet_hours = quiet_hours
+        self.last_plan: Optional[DeliveryPlan] = None
+        # Период проверки новых поздравлений, сек (если сигнала от обработчика не было)
+        self.planning_interval = planning_interval
+        # Наибольший id поздравления, учтенного в плане; None - полного плана еще не было
+        self._watermark: Optional[int] = None
+        # Сколько поздравлений уже запланировано на каждую минуту (начало минуты
+        # в epoch-секундах): дополнения плана не превышают потолок отправки
+        self._slot_load: Dict[int, int] = {}
+        self._new_congrats: Optional[asyncio.Event] = None
+        self._planning_task: Optional[asyncio.Task] = None
+        # Прогресс идущего полного планирования, None - планирование не идет
+        self.planning: Optional[PlanningProgress] = None
+        # Лок лидера среди реплик; None - реплика одна, выбор лидера не нужен
+        self.leader_lock: Optional[LeaderLock] = None
+        self._leadership_task: Optional[asyncio.Task] = None
+
+        # Куча (timestamp, seq, item); seq сохраняет порядок при равном времени
+        self._heap: List[Tuple[float, int, DeliveryItem]] = []
+        self._seq = itertools.count()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._dispatcher_task: Optional[asyncio.Task] = None
+        self._outbox_task: Optional[asyncio.Task] = None
+        self._lease_task: Optional[asyncio.Task] = None
+        # Забранные этим процессом доставки: delivery_id -> метка аренды (claimed_at)
+        self._claims: Dict[int, datetime] = {}
+        self._workers: List[asyncio.Task] = []
+        self._in_progress = 0
+        self._latency_total = 0.0
+        self._latency_count = 0
+
+        # Счетчики для get_schedule_info
+        self.total_planned = 0
+        self.total_scheduled = 0
+        self.total_sent = 0
+
+    def _get_bot(self) -> Bot:
+        if not self.bot:
+            cfg = load_config()
+            self.bot = setup_rate_limit(Bot(
+                token=cfg.bot.token,
+                default=DefaultBotProperties(parse_mode=ParseMode.HTML)
+            ))
+        return self.bot
+
+    @staticmethod
+    def _format_congrat(congrat: CongratRecord) -> str:
+        return f"👤 От {congrat.sender_name}:\n{congrat.message}"
+
+    async def _send_to_recipient(self, congrat: CongratRecord, recipient_id: int) -> int:
+        """
+        Отправка поздравления одному получателю, возвращает message_id.
+        Ошибки пробрасываются
+        """
+        bot = self._get_bot()
+        if congrat.photo_file_id:
+            message = await bot.send_photo(
+                chat_id=recipient_id,
+                photo=congrat.photo_file_id,
+                caption=self._format_congrat(congrat)
+            )
+        else:
+            message = await bot.send_message(
+                chat_id=recipient_id,
+                text=self._format_congrat(congrat)
+            )
+        return message.message_id
+
+    async def _send_album(
+        self, congrats: List[CongratRecord], recipient_id: int
+    ) -> List[int]:
+        messages = await self._get_bot().send_media_group(
+            chat_id=recipient_id,
+            media=[
+                InputMediaPhoto(
+                    media=congrat.photo_file_id,
+                    caption=self._format_congrat(congrat),
+                )
+                for congrat in congrats
+            ],
+        )
+        return [message.message_id for message in messages]
+
+    async def _send_merged_text(self, texts: List[str], recipient_id: int) -> List[int]:
+        message = await self._get_bot().send_message(
+            chat_id=recipient_id, text="\n\n".join(texts)
+        )
+        return [message.message_id] * len(texts)
+
+    async def _send_single(self, congrat: CongratRecord, recipient_id: int) -> List[int]:
+        return [await self._send_to_recipient(congrat, recipient_id)]
+
+    def _message_groups(
+        self, congrats: Tuple[CongratRecord, ...], recipient_id: int
+    ) -> Iterator[Tuple[List[int], Callable[[], Awaitable[List[int]]]]]:
+        """
+        Разбиение поздравлений одного получателя на вызовы API:
+        (индексы поздравлений, вызов, возвращающий их message_id).
+        Фото уходят альбомами до 10 штук, тексты - одним сообщением до 4096 символов
+        """
+        if len(congrats) == 1:
+            yield [0], partial(self._send_single, congrats[0], recipient_id)
+            return
+
+        photos = [i for i, congrat in enumerate(congrats) if congrat.photo_file_id]
+        for start in range(0, len(photos), MEDIA_GROUP_LIMIT):
+            chunk = photos[start:start + MEDIA_GROUP_LIMIT]
+            if len(chunk) == 1:
+                yield chunk, partial(self._send_single, congrats[chunk[0]], recipient_id)
+            else:
+                yield chunk, partial(
+                    self._send_album, [congrats[i] for i in chunk], recipient_id
+                )
+
+        chunk, texts, length = [], [], 0
+        for i, congrat in enumerate(congrats):
+            if congrat.photo_file_id:
+                continue
+            text = self._format_congrat(congrat)
+            if texts and length + 2 + len(text) > TEXT_LIMIT:
+                yield chunk, partial(self._send_merged_text, texts, recipient_id)
+                chunk, texts, length = [], [], 0
+            chunk.append(i)
+            texts.append(text)
+            length += len(text) + (2 if len(texts) > 1 else 0)
+        if chunk:
+            yield chunk, partial(self._send_merged_text, texts, recipient_id)
+
+    async def _send_with_result(
+        self, congrats: Tuple[CongratRecord, ...], recipient_id: int
+    ) -> List[DeliveryResult]:
+        """
+        Отправка одному получателю без исключений: по результату на каждое
+        поздравление, ошибка попадает в результат
+        """
+        results = [DeliveryResult(recipient_id) for _ in congrats]
+        started = time.monotonic()
+        for indices, send in self._message_groups(congrats, recipient_id):
+            if dead_chats.is_dead(recipient_id):
+                for i in indices:
+                    results[i].error = "recipient blocked"
+                    results[i].dead_chat = True
+                continue
+
+            try:
+                message_ids = await send()
+            except Exception as e:
+                dead_chat = is_dead_chat_error(e)
+                for i in indices:
+                    results[i].error = str(e)
+                    results[i].dead_chat = dead_chat
+                if dead_chat:
+                    dead_chats.add(recipient_id)
+                else:
+                    logger.error(f"Ошибка отправки → {recipient_id}: {e}")
+                continue
+
+            for i, message_id in zip(indices, message_ids):
+                results[i].message_id = message_id
+
+        latency = time.monotonic() - started
+        for result in results:
+            result.latency = latency
+        return results
+
+    async def fan_out_many(
+        self, congrats: Tuple[CongratRecord, ...], recipient_ids: Tuple[int, ...]
+    ) -> List[List[DeliveryResult]]:
+        """
+        Отправка поздравлений всем получателям одновременно,
+        темп задает общий лимитер сессии бота
+        """
+        return list(await asyncio.gather(*(
+            self._send_with_result(congrats, recipient_id)
+            for recipient_id in recipient_ids
+        )))
+
+    async def fan_out(
+        self, congrat: CongratRecord, recipient_ids: Tuple[int, ...]
+    ) -> List[DeliveryResult]:
+        """
+        Отправка одного поздравления всем получателям одновременно
+        """
+        results = await self.fan_out_many((congrat,), recipient_ids)
+        return [recipient_results[0] for recipient_results in results]
 
     async def send_single_congratulation(
         self,
-        sender_name: str,
-        congrat: Dict,
+        congrat: CongratRecord,
         user1_id: int,
         user2_id: int
-    ) -> None:
+    ) -> List[DeliveryResult]:
         """
         Отправка одного поздравления обоим партнерам
         """
-        if not self.bot:
-            cfg = load_config()
-            self.bot = Bot(
-                token=cfg.bot.token,
-                default=DefaultBotProperties(parse_mode=ParseMode.HTML)
-            )
+        results = await self.fan_out(congrat, (user1_id, user2_id))
+        if all(result.ok for result in results):
+            logger.debug(f"✅ Отправлено поздравление от {congrat.sender_name} обоим партнерам")
+        return results
+
+    def _ensure_dispatcher(self) -> None:
+        """
+        Ленивый запуск диспетчера и пула воркеров в текущем event loop
+        """
+        if self._dispatcher_task and not self._dispatcher_task.done():
+            return
+
+        self._wakeup = asyncio.Event()
+        # Ограниченная очередь: диспетчер не обгоняет воркеров больше чем на пул
+        self._queue = asyncio.Queue(maxsize=self.workers_count * 2)
+        self._dispatcher_task = asyncio.create_task(self._dispatch_loop())
+        self._outbox_task = asyncio.create_task(self._outbox_loop())
+        self._lease_task = asyncio.create_task(self._lease_loop())
+        self._workers = [
+            asyncio.create_task(self._worker_loop())
+            for _ in range(self.workers_count)
+        ]
+
+    async def _dispatch_loop(self) -> None:
+        """
+        Единственный цикл, который ждет ближайшего времени отправки
+        """
+        while True:
+            if not self._heap:
+                await self._wakeup.wait()
+                self._wakeup.clear()
+                continue
+
+            wait_seconds = self._heap[0][0] - time.time()
+            if wait_seconds > 0:
+                # Просыпаемся либо к сроку, либо при появлении более раннего элемента
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=wait_seconds)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+                continue
+
+            _, _, item = heapq.heappop(self._heap)
+            await self._queue.put(item)
+
+    async def _outbox_loop(self) -> None:
+        """
+        Подгрузка наступивших доставок из outbox пачками
+        """
+        while True:
+            # Не держим в памяти больше нескольких пачек
+            if len(self._heap) >= self.batch_size * 4:
+                await asyncio.sleep(self.poll_interval)
+                continue
 
-        # Функция для отправки одного сообщения
-        async def send_message(recipient_id: int):
             try:
-                if congrat.get("photo_file_id"):
-                    await self.bot.send_photo(
-                        chat_id=recipient_id,
-                        photo=congrat["photo_file_id"],
-                        caption=f"👤 От {sender_name}:\n{congrat['message']}"
-                    )
-                else:
-                    await self.bot.send_message(
-                        chat_id=recipient_id,
-                        text=f"👤 От {sender_name}:\n{congrat['message']}"
-                    )
-                await asyncio.sleep(0.04)  # Rate limiting: ~25 сообщений/сек
+                # При склейке забираем доставки на окно вперед: они уйдут
+                # вместе с самой ранней доставкой своей группы
+                until = datetime.now().astimezone() + timedelta(
+                    seconds=self.poll_interval + self.coalesce_window
+                )
+                rows = await claim_due_deliveries(
+                    until, self.batch_size, lease=timedelta(seconds=self.claim_lease)
+                )
             except Exception as e:
-                logger.error(f"Ошибка отправки {sender_name} → {recipient_id}: {e}")
+                logger.error(f"Ошибка чтения outbox: {e}")
+                await asyncio.sleep(self.poll_interval)
+                continue
+
+            # Группируем получателей одного поздравления в один элемент
+            grouped: Dict[int, Tuple[datetime, CongratRecord, List[Tuple[int, int]]]] = {}
+            for row in rows:
+                entry = grouped.get(row["congratulation_id"])
+                if entry is None:
+                    congrat = CongratRecord(
+                        id=row["congratulation_id"],
+                        sender_name=row["first_name"],
+                        message=row["message"],
+                        photo_file_id=row["photo_file_id"],
+                    )
+                    entry = (row["send_at"], congrat, [])
+                    grouped[row["congratulation_id"]] = entry
+                entry[2].append((row["id"], row["recipient_id"]))
+                self._claims[row["id"]] = row["claimed_at"]
+
+            if self.coalesce_window:
+                for send_at, item in self._coalesce(list(grouped.values())):
+                    self._push(item, send_at)
+            else:
+                for send_at, congrat, recipients in grouped.values():
+                    self.schedule_congratulation(congrat, tuple(recipients), send_at)
 
-        # Отправляем обоим партнерам
-        await send_message(user1_id)
-        await send_message(user2_id)
+            # Полная пачка - вероятно, есть еще наступившие доставки
+            if len(rows) < self.batch_size:
+                await asyncio.sleep(self.poll_interval)
 
-        logger.debug(f"✅ Отправлено поздравление от {sender_name} обоим партнерам")
+    async def _lease_loop(self) -> None:
+        """
+        Продление аренды доставок, которые ждут отправки в памяти процесса.
+        После 429 лимитер снижает темп, и очередь может разбираться дольше
+        claim_lease: без продления доставки забрал бы другой процесс и
+        отправил повторно
+        """
+        while True:
+            await asyncio.sleep(self.claim_lease / 3)
+            by_claim: Dict[datetime, List[int]] = {}
+            for delivery_id, claimed_at in self._claims.items():
+                by_claim.setdefault(claimed_at, []).append(delivery_id)
+
+            renewed_at = datetime.now().astimezone()
+            for claimed_at, delivery_ids in by_claim.items():
+                for i in range(0, len(delivery_ids), self.batch_size):
+                    chunk = delivery_ids[i:i + self.batch_size]
+                    try:
+                        renewed = set(await renew_delivery_claims(chunk, claimed_at, renewed_at))
+                    except Exception as e:
+                        logger.error(f"Ошибка продления аренды доставок: {e}")
+                        continue
+                    for delivery_id in chunk:
+                        if delivery_id not in self._claims:
+                            continue  # Отправлена, пока шло продление
+                        if delivery_id in renewed:
+                            self._claims[delivery_id] = renewed_at
+                        else:
+                            # Аренду потеряли: доставку ведет другой процесс
+                            del self._claims[delivery_id]
+
+    def _owned_recipients(
+        self, item: DeliveryItem
+    ) -> Tuple[Tuple[Tuple[int, ...], int], ...]:
+        """Получатели элемента, все доставки которых все еще арендованы этим процессом"""
+        return tuple(
+            (delivery_ids, recipient_id)
+            for delivery_ids, recipient_id in item.recipients
+            if all(delivery_id in self._claims for delivery_id in delivery_ids)
+        )
+
+    async def _worker_loop(self) -> None:
+        """
+        Воркер пула: отправляет наступившие поздравления
+        """
+        while True:
+            item: DeliveryItem = await self._queue.get()
+            self._in_progress += 1
+            try:
+                owned = self._owned_recipients(item)
+                if len(owned) < len(item.recipients):
+                    logger.warning(
+                        f"⚠️ Пропуск {len(item.recipients) - len(owned)} получателей: "
+                        f"аренда доставок истекла, их отправит другой процесс"
+                    )
+                    if not owned:
+                        continue
+                    item = DeliveryItem(congratulations=item.congratulations, recipients=owned)
+                senders = ", ".join(sorted({c.sender_name for c in item.congratulations}))
+                logger.info(f"🎉 Отправка поздравлений ({len(item.congratulations)}) от {senders}")
+                results = await self.fan_out_many(item.congratulations, item.recipient_ids)
+                await asyncio.gather(*(
+                    self._record_result(delivery_id, result)
+                    for (delivery_ids, _), recipient_results in zip(item.recipients, results)
+                    for delivery_id, result in zip(delivery_ids, recipient_results)
+                ))
+                self.total_sent += len(item.congratulations)
+            except Exception as e:
+                logger.error(f"Ошибка в воркере планировщика: {e}")
+            finally:
+                # Незаписанные доставки вернутся в работу по истечении аренды
+                for delivery_ids, _ in item.recipients:
+                    for delivery_id in delivery_ids:
+                        self._claims.pop(delivery_id, None)
+                self._in_progress -= 1
+                self._queue.task_done()
+
+    async def _record_result(self, delivery_id: int, result: DeliveryResult) -> None:
+        """
+        Запись результата доставки в outbox
+        """
+        self._latency_total += result.latency
+        self._latency_count += 1
+        claimed_at = self._claims.get(delivery_id)
+        if result.ok:
+            recorded = await complete_delivery(
+                delivery_id, message_id=result.message_id, claimed_at=claimed_at
+            )
+        elif result.dead_chat:
+            # Повторять бессмысленно: сразу failed
+            recorded = await complete_delivery(
+                delivery_id, result.error, max_attempts=1, claimed_at=claimed_at
+            )
+        else:
+            recorded = await complete_delivery(delivery_id, result.error, claimed_at=claimed_at)
+        if not recorded:
+            logger.warning(f"⚠️ Результат доставки {delivery_id} не записан: аренда потеряна")
 
-    async def schedule_congratulation(
+    def schedule_congratulation(
         self,
-        sender_name: str,
-        congrat: Dict,
-        user1_id: int,
-        user2_id: int,
+        congrat: CongratRecord,
+        recipients: Tuple[Tuple[int, int], ...],
         send_time: datetime
     ) -> None:
         """
-        Запланировать отправку одного поздравления на конкретное время
+        Поставить загруженное из outbox поздравление в очередь на конкретное время.
+        recipients: ((delivery_id, recipient_id), ...)
         """
-        async def scheduled_send():
-            # Вычисляем сколько ждать до отправки
-            now = datetime.now()
-            if send_time > now:
-                wait_seconds = (send_time - now).total_seconds()
-                if wait_seconds > 0:
-                    logger.debug(f"⏳ Ожидание {wait_seconds:.0f} сек для отправки поздравления от {sender_name}")
-                    await asyncio.sleep(wait_seconds)
-
-            # Отправляем
-            logger.info(f"🎉 Отправка поздравления от {sender_name}")
-            await self.send_single_congratulation(sender_name, congrat, user1_id, user2_id)
-
-        # Создаем и сохраняем задачу
-        task = asyncio.create_task(scheduled_send())
-        self.scheduled_tasks.append(task)
-        return task
+        item = DeliveryItem(
+            congratulations=(congrat,),
+            recipients=tuple(
+                ((delivery_id,), recipient_id) for delivery_id, recipient_id in recipients
+            ),
+        )
+        self._push(item, send_time)
+
+    def _push(self, item: DeliveryItem, send_time: datetime) -> None:
+        self._ensure_dispatcher()
+
+        timestamp = send_time.timestamp()
+        # Будим диспетчер, только если новый элемент стал ближайшим
+        is_earliest = not self._heap or timestamp < self._heap[0][0]
+        heapq.heappush(self._heap, (timestamp, next(self._seq), item))
+        self.total_scheduled += 1
+        if is_earliest:
+            self._wakeup.set()
+
+    def _coalesce(
+        self, entries: List[Tuple[datetime, CongratRecord, List[Tuple[int, int]]]]
+    ) -> List[Tuple[datetime, DeliveryItem]]:
+        """
+        Склейка поздравлений с одинаковыми получателями, чьи send_at попадают
+        в окно coalesce_window от первого из них. Группа уходит в send_at первого
+        """
+        window = timedelta(seconds=self.coalesce_window)
+        Group = Tuple[datetime, List[CongratRecord], Dict[int, List[int]]]
+        groups: List[Group] = []
+        open_groups: Dict[Tuple[int, ...], Group] = {}
+
+        for send_at, congrat, recipients in sorted(entries, key=lambda e: e[0]):
+            key = tuple(sorted(recipient_id for _, recipient_id in recipients))
+            group = open_groups.get(key)
+            if (
+                group is None
+                or send_at - group[0] > window
+                or len(group[1]) >= MEDIA_GROUP_LIMIT
+            ):
+                group = (send_at, [], {recipient_id: [] for recipient_id in key})
+                open_groups[key] = group
+                groups.append(group)
+
+            group[1].append(congrat)
+            for delivery_id, recipient_id in recipients:
+                group[2][recipient_id].append(delivery_id)
+
+        return [
+            (
+                send_at,
+                DeliveryItem(
+                    congratulations=tuple(congrats),
+                    recipients=tuple(
+                        (tuple(delivery_ids), recipient_id)
+                        for recipient_id, delivery_ids in deliveries.items()
+                    ),
+                ),
+            )
+            for send_at, congrats, deliveries in groups
+        ]
 
-    async def schedule_all_congratulations(self) -> None:
+    async def start(self, reset_queued: bool = True) -> None:
+        """
+        Запуск диспетчера: доставки, загруженные до перезапуска и с истекшей
+        арендой, возвращаются в ожидание. Свежие доставки в queued принадлежат
+        работающим воркерам и не трогаются.
+        Воркеры, которых несколько, запускаются с reset_queued=False:
+        зависшие доставки они и так заберут по истечении аренды
+        """
+        if reset_queued:
+            restored = await reset_queued_deliveries(timedelta(seconds=self.claim_lease))
+            if restored:
+                logger.info(f"♻️ Возвращено в ожидание {restored} доставок после перезапуска")
+        self._ensure_dispatcher()
+
+    def _campaign_window(
+        self, test_mode: bool = False, now: Optional[datetime] = None
+    ) -> Optional[Tuple[datetime, datetime]]:
+        """
+        Окно отправки (начало, конец) на момент now (по умолчанию - текущий).
+        None - кампания еще не началась или уже закончилась (вне 01.01-13.01.2026
+        и не тестовый режим): поздравления, написанные после нее, ждут
+        следующего Нового года, а не уходят через пару минут
+        """
+        now = now or datetime.now()
+        if test_mode:
+            # Для тестов: начинаем через 60 секунд, заканчиваем через 2 дня
+            start_time = now + timedelta(seconds=60)
+            return start_time, start_time + timedelta(days=2)
+        if now.year != 2026:
+            return None
+
+        # Для продакшена: 00:00 01.01.2026 - 23:59:59 13.01.2026
+        original_start_time = datetime(2026, 1, 1, 0, 0, 0)
+        end_date = datetime(2026, 1, 13, 23, 59, 59)
+        if now > end_date:
+            return None
+        # Если бот запущен позже начала, начинаем с текущего момента
+        return max(original_start_time, now), end_date
+
+    async def _store_plan(
+        self,
+        congrat_ids: Sequence[int],
+        user1_ids: Sequence[int],
+        user2_ids: Sequence[int],
+        plan: DeliveryPlan,
+    ) -> None:
+        """Сохранить план в outbox: каждое поздравление уходит обоим партнерам"""
+        total = len(congrat_ids)
+        # Перемешиваем время для случайного порядка поздравлений;
+        # обоим получателям поздравления - одно и то же время
+        send_times = plan.send_times[np.random.default_rng().permutation(total)]
+        # Обе доставки поздравления идут подряд (user1, user2), а пачка четная:
+        # они всегда попадают в один INSERT. Иначе прерванное между пачками
+        # сохранение оставило бы поздравление с одной доставкой, и второй
+        # партнер его уже никогда не получил бы - повторное планирование
+        # пропускает поздравления, у которых есть доставки
+        all_congrats = np.repeat(np.asarray(congrat_ids, dtype=np.int64), 2)
+        all_recipients = np.column_stack([
+            np.asarray(user1_ids, dtype=np.int64), np.asarray(user2_ids, dtype=np.int64)
+        ]).ravel()
+        all_send_times = np.repeat(send_times, 2)
+
+        # Сохраняем план в outbox пачками, массивами, без промежуточных словарей
+        chunk = self.batch_size * 20 // 2 * 2
+        for i in range(0, len(all_congrats), chunk):
+            await create_deliveries(
+                all_congrats[i:i + chunk],
+                all_recipients[i:i + chunk],
+                all_send_times[i:i + chunk],
+            )
+            if self.planning:
+                self.planning.stored += len(all_congrats[i:i + chunk])
+
+        # Учитываем занятые минуты для следующих дополнений плана
+        slots, counts = np.unique(
+            (plan.send_times // 60 * 60).astype(np.int64), return_counts=True
+        )
+        for slot, count in zip(slots.tolist(), counts.tolist()):
+            self._slot_load[slot] = self._slot_load.get(slot, 0) + count
+
+    async def schedule_all_congratulations(
+        self, dry_run: bool = False, test_mode: Optional[bool] = None
+    ) -> Optional[DeliveryPlan]:
         """
         Основная функция планирования всех поздравлений
-        Каждое поздравление отправляется один раз, обоим партнерам, в случайное время
+        Каждое поздравление отправляется один раз, обоим партнерам, в случайное время.
+        При dry_run только строит план и возвращает прогноз, outbox не меняется.
+        test_mode по умолчанию берется из is_test_mode; фоновое планирование
+        всегда работает с окном настоящей кампании.
+        Пока план строится, его ход виден в self.planning (кроме dry_run:
+        прогноз может идти одновременно с фоновым планированием)
         """
-        # Проверяем год (если не в тестовом режиме)
-        current_year = datetime.now().year
-        if not self.is_test_mode and current_year != 2026:
-            logger.info(f"⏸️ Пропускаем планирование. Текущий год: {current_year}, "
-                       f"ожидается 2026. Планировщик будет ждать.")
-            return
-
-        # Получаем все пары из базы
-        pairs = await get_all_partner_pairs()
-        if not pairs:
-            logger.info("📭 Нет пар партнеров для отправки поздравлений")
+        if test_mode is None:
+            test_mode = self.is_test_mode
+        if dry_run:
+            return await self._plan_all(dry_run, test_mode)
+        self.planning = PlanningProgress()
+        try:
+            return await self._plan_all(dry_run, test_mode)
+        finally:
+            self.planning = None
+
+    async def _plan_all(self, dry_run: bool, test_mode: bool) -> Optional[DeliveryPlan]:
+        window = self._campaign_window(test_mode)
+        if window is None:
+            logger.info(f"⏸️ Пропускаем планирование: {datetime.now():%d.%m.%Y} вне кампании "
+                       f"01.01-13.01.2026. Планировщик будет ждать.")
             return
-
-        logger.info(f"📅 Начинаем планирование для {len(pairs)} пар")
-
-        # Определяем временные границы
-        now = datetime.now()
-        if self.is_test_mode:
-            # Для тестов: начинаем через 60 секунд, заканчиваем через 2 дня
-            start_time = datetime.now() + timedelta(seconds=60)
-            end_date = start_time + timedelta(days=2)
+        start_time, end_date = window
+        if test_mode:
             logger.info("🔬 ТЕСТОВЫЙ РЕЖИМ: отправка начнется через 60 секунд")
-        else:
-            # Для продакшена: 00:00 01.01.2026 - 23:59:59 13.01.2026
-            original_start_time = datetime(2026, 1, 1, 0, 0, 0)
-            end_date = datetime(2026, 1, 13, 23, 59, 59)
-            
-            # Если start_time уже прошло, начинаем с текущего момента
-            if now > original_start_time:
-                if now > end_date:
-                    # Если мы уже после end_date - отправляем все сразу
-                    logger.warning(f"⚠️ Период рассылки уже прошел (до {end_date}), отправляем все поздравления немедленно")
-                    start_time = now
-                    end_date = now + timedelta(minutes=5)  # Распределим на 5 минут
-                else:
-                    # Если мы в периоде, но после start_time - начинаем с текущего момента
-                    start_time = now
-                    logger.info(f"⏰ Период рассылки начался ({original_start_time}), но бот запущен позже. Начинаем с текущего момента до {end_date}")
-            else:
-                start_time = original_start_time
-                logger.info(f"🎯 ПРОДАКШЕН: отправка с {start_time} по {end_date}")
-
-        # Собираем все поздравления и планируем каждое отдельно
-        all_congratulations = []
-        total_congrats = 0
-
-        for pair in pairs:
-            user1 = pair["user1"]
-            user2 = pair["user2"]
-            user1_id = user1["telegram_id"]
-            user2_id = user2["telegram_id"]
-
-            # Добавляем поздравления от user1
-            for congrat in user1["congratulations"]:
-                all_congratulations.append({
-                    "sender_name": user1["first_name"],
-                    "congrat": congrat,
-                    "user1_id": user1_id,
-                    "user2_id": user2_id
-                })
-                total_congrats += 1
-
-            # Добавляем поздравления от user2
-            for congrat in user2["congratulations"]:
-                all_congratulations.append({
-                    "sender_name": user2["first_name"],
-                    "congrat": congrat,
-                    "user1_id": user1_id,
-                    "user2_id": user2_id
-                })
-                total_congrats += 1
-
-        if not all_congratulations:
+        logger.info(f"📅 Начинаем планирование: отправка с {start_time} по {end_date}")
+
+        # Отметка читается до прохода по парам и с отставанием: созданное позже
+        # дополнит план, повторная вставка в outbox игнорируется
+        now = datetime.now().astimezone()
+        watermark = None if dry_run else await get_max_congratulation_id(now - WATERMARK_LAG)
+        # Минуты, уже занятые доставками в outbox (план прошлого лидера или запуска)
+        load = await get_planned_load(now)
+        slot_load = {slot: math.ceil(count / 2) for slot, count in load.items()}
+
+        # Для плана нужны только id поздравлений и получатели, копим их в списках
+        congrat_ids: List[int] = []
+        user1_ids: List[int] = []
+        user2_ids: List[int] = []
+        total_pairs = 0
+
+        # Пары с поздравлениями, которых еще нет в outbox, читаются потоком
+        async for pair in get_all_partner_pairs(unplanned_only=True):
+            total_pairs += 1
+            count = len(pair.congratulations)
+            congrat_ids.extend(congrat.id for congrat in pair.congratulations)
+            user1_ids.extend([pair.user1_id] * count)
+            user2_ids.extend([pair.user2_id] * count)
+            if self.planning:
+                self.planning.pairs = total_pairs
+                self.planning.congratulations = len(congrat_ids)
+            if total_pairs % 10000 == 0:
+                logger.info(
+                    f"⏳ Планирование: прочитано {total_pairs} пар, "
+                    f"{len(congrat_ids)} поздравлений"
+                )
+
+        total_congrats = len(congrat_ids)
+        if not total_congrats:
             logger.info("📭 Нет поздравлений для отправки")
+            if watermark is not None:
+                self._slot_load = slot_load
+                self._watermark = watermark
             return
 
         logger.info(f"📝 Найдено {total_congrats} поздравлений для планирования")
 
-        if total_congrats == 0:
-            logger.warning("Нет поздравлений для планирования")
-            return
+        # Время отправки с учетом пропускной способности и тихих часов
+        plan = plan_send_times(
+            total_congrats,
+            start=max(start_time, datetime.now()),
+            end=end_date,
+            messages_per_minute=self.send_rate * 60,
+            quiet_hours=self.quiet_hours,
+            load=slot_load,
+        )
+        logger.info(
+            f"📈 Прогноз: пик {plan.peak_per_minute * 2} сообщ/мин "
+            f"({plan.peak_messages_per_second * 2:.1f} сообщ/сек) при потолке "
+            f"{self.send_rate * 60:.0f} сообщ/мин, последняя отправка {plan.end}"
+        )
+        if plan.overflow:
+            logger.warning(
+                f"⚠️ Окно до {end_date} не вмещает {total_congrats} поздравлений "
+                f"при текущем лимите, план продлен до {plan.end}"
+            )
+        if dry_run:
+            return plan
+
+        self.last_plan = plan
+        self._slot_load = slot_load
+        await self._store_plan(congrat_ids, user1_ids, user2_ids, plan)
+        self._watermark = watermark
+        self.total_planned += total_congrats
+
+        logger.info(f"✅ Запланировано {total_congrats} поздравлений для {total_pairs} пар")
+        return plan
 
-        # Перемешиваем для случайного распределения во времени
-        random.shuffle(all_congratulations)
-
-        # Вычисляем оставшееся время
-        now = datetime.now()
-        remaining_time_range = int((end_date - start_time).total_seconds())
-        
-        # Если времени осталось мало (меньше 1 минуты) или уже прошло - отправляем все сразу с небольшими задержками
-        if remaining_time_range <= 60 or now >= end_date:
-            logger.info(f"⚡ Времени осталось мало ({remaining_time_range} сек) или период прошел. Отправляем все поздравления с небольшими задержками")
-            for i, item in enumerate(all_congratulations):
-                # Небольшая задержка между отправками (1-2 секунды)
-                send_time = now + timedelta(seconds=i * 1.5)
-                await self.schedule_congratulation(
-                    sender_name=item["sender_name"],
-                    congrat=item["congrat"],
-                    user1_id=item["user1_id"],
-                    user2_id=item["user2_id"],
-                    send_time=send_time
+    async def schedule_new_congratulations(self) -> int:
+        """
+        Дополнить план поздравлениями, созданными после последнего планирования.
+        Читаются только еще не запланированные поздравления с id выше водяной
+        отметки, поэтому работа пропорциональна числу новых поздравлений.
+        Отметка отстает на WATERMARK_LAG, так что поздравление, закоммиченное
+        позже соседа с большим id, не теряется. Новые поздравления занимают
+        только свободные места в минутах плана. Поздравления отправителей
+        без пары пропускаются. Возвращает число добавленных в план
+        """
+        window = self._campaign_window()
+        if window is None or self._watermark is None:
+            return 0
+        start_time, end_date = window
+        safe_watermark = await get_max_congratulation_id(
+            datetime.now().astimezone() - WATERMARK_LAG
+        )
+
+        added = 0
+        after_id = self._watermark
+        while True:
+            rows = await get_congratulations_after(after_id, self.batch_size)
+            if not rows:
+                break
+            paired = [row for row in rows if row[1] is not None]
+            if paired:
+                congrat_ids, user1_ids, user2_ids = zip(*paired)
+                plan = plan_send_times(
+                    len(paired),
+                    start=start_time,
+                    end=end_date,
+                    messages_per_minute=self.send_rate * 60,
+                    quiet_hours=self.quiet_hours,
+                    load=self._slot_load,
                 )
-        else:
-            # Первое поздравление в start_time (или сейчас, если start_time в прошлом)
-            first_item = all_congratulations[0]
-            first_send_time = max(start_time, now)
-            await self.schedule_congratulation(
-                sender_name=first_item["sender_name"],
-                congrat=first_item["congrat"],
-                user1_id=first_item["user1_id"],
-                user2_id=first_item["user2_id"],
-                send_time=first_send_time
-            )
-            logger.info(f"⏰ Первое поздравление запланировано на {first_send_time}")
-
-            # Остальные поздравления распределяем случайно по оставшемуся времени
-            if total_congrats > 1:
-                # Время начинается с 1 минуты после start_time (или сейчас, если start_time в прошлом)
-                remaining_start = max(start_time + timedelta(seconds=60), now)
-                remaining_time_range = int((end_date - remaining_start).total_seconds())
-                
-                # Если времени осталось очень мало, отправляем с небольшими задержками
-                if remaining_time_range <= 0:
-                    remaining_start = now
-                    remaining_time_range = 60  # Минимум 1 минута для распределения
-
-                # Равномерно распределяем оставшиеся поздравления
-                remaining_congrats = total_congrats - 1
-                step = remaining_time_range / max(1, remaining_congrats - 1) if remaining_congrats > 1 else remaining_time_range
-
-                for i, item in enumerate(all_congratulations[1:], start=1):
-                    # Базовое время - равномерное распределение
-                    base_offset = (i - 1) * step
-
-                    # Добавляем случайное отклонение (±10% от шага)
-                    random_deviation = random.uniform(-step * 0.1, step * 0.1)
-                    total_offset = base_offset + random_deviation
-
-                    # Убеждаемся, что offset в допустимых пределах
-                    total_offset = max(0, min(total_offset, remaining_time_range))
-
-                    send_time = remaining_start + timedelta(seconds=int(total_offset))
-
-                    # Убеждаемся, что время не выходит за границы и не в прошлом
-                    if send_time > end_date:
-                        send_time = end_date
-                    if send_time < now:
-                        send_time = now + timedelta(seconds=i * 1.5)  # Минимальная задержка
-
-                    await self.schedule_congratulation(
-                        sender_name=item["sender_name"],
-                        congrat=item["congrat"],
-                        user1_id=item["user1_id"],
-                        user2_id=item["user2_id"],
-                        send_time=send_time
-                    )
+                await self._store_plan(congrat_ids, user1_ids, user2_ids, plan)
+                added += len(paired)
+            after_id = rows[-1][0]
+            if len(rows) < self.batch_size:
+                break
+        self._watermark = max(self._watermark, safe_watermark)
+
+        if added:
+            self.total_planned += added
+            logger.info(f"➕ В план добавлено новых поздравлений: {added}")
+        return added
+
+    def notify_new_congratulation(self) -> None:
+        """Сигнал от обработчика: сохранено новое поздравление"""
+        if self._new_congrats is not None:
+            self._new_congrats.set()
+
+    def start_planning(self) -> None:
+        """Запуск фонового планирования, не дожидаясь его окончания"""
+        if self._planning_task is None or self._planning_task.done():
+            self._new_congrats = asyncio.Event()
+            self._planning_task = asyncio.create_task(self._planning_loop())
+
+    async def _planning_loop(self) -> None:
+        """
+        Фоновое планирование: сначала полный план, затем дополнение плана
+        по сигналу обработчика или раз в planning_interval секунд
+        (поздравление могло быть создано другим процессом)
+        """
+        while True:
+            if self._campaign_window() is not None:
+                try:
+                    if self._watermark is None:
+                        # Полного плана еще не было: запуск или кампания только началась
+                        await self.schedule_all_congratulations(test_mode=False)
+                    else:
+                        await self.schedule_new_congratulations()
+                except Exception as e:
+                    logger.error(f"Ошибка планирования: {e}")
 
-        logger.info(f"✅ Запланировано {total_congrats} поздравлений для {len(pairs)} пар")
+            try:
+                await asyncio.wait_for(self._new_congrats.wait(), self.planning_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._new_congrats.clear()
+
+    def start_leadership(self) -> None:
+        """Запуск выбора лидера: планирование и отправка начнутся, когда реплика им станет"""
+        if self._leadership_task is None or self._leadership_task.done():
+            self._leadership_task = asyncio.create_task(self._leadership_loop())
+
+    @property
+    def is_leader(self) -> bool:
+        return self.leader_lock is None or self.leader_lock.is_held
+
+    async def _leadership_loop(self) -> None:
+        while True:
+            await self.leader_lock.acquire()
+            logger.info("👑 Реплика стала лидером: запускаем планирование и отправку")
+            try:
+                if not self.external_workers:
+                    await self.start()
+                self.start_planning()
+                await self.leader_lock.wait_lost()
+                logger.warning("⚠️ Лидерство потеряно, останавливаем планирование и отправку")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Например, база недоступна при запуске: уступаем и пробуем снова
+                logger.error(f"Ошибка при запуске лидера, уступаем лидерство: {e}")
+            finally:
+                await self._stop_tasks()
+                await self.leader_lock.release()
+            await asyncio.sleep(self.leader_lock.check_interval)
 
     async def run_test_now(self) -> None:
         """
@@ -268,63 +879,86 @@ class NewYearScheduler:
         """
         logger.info("🧪 ЗАПУСК ТЕСТА ОТПРАВКИ")
 
-        pairs = await get_all_partner_pairs()
-        if not pairs:
+        total_sent = 0
+        total_pairs = 0
+        async for pair in get_all_partner_pairs():
+            total_pairs += 1
+            # Все поздравления пары уходят одновременно, паузы задает лимитер
+            await asyncio.gather(*(
+                self.fan_out(congrat, pair.recipients) for congrat in pair.congratulations
+            ))
+            total_sent += len(pair.congratulations)
+
+        if not total_pairs:
             logger.warning("Нет пар для теста")
             return
 
-        logger.info(f"Тестируем отправку для {len(pairs)} пар")
-
-        total_sent = 0
-        for pair in pairs:
-            user1 = pair["user1"]
-            user2 = pair["user2"]
-            user1_id = user1["telegram_id"]
-            user2_id = user2["telegram_id"]
-
-            # Отправляем все поздравления от user1
-            for congrat in user1["congratulations"]:
-                await self.send_single_congratulation(
-                    sender_name=user1["first_name"],
-                    congrat=congrat,
-                    user1_id=user1_id,
-                    user2_id=user2_id
-                )
-                total_sent += 1
-                await asyncio.sleep(0.1)  # Небольшая пауза между отправками
-
-            # Отправляем все поздравления от user2
-            for congrat in user2["congratulations"]:
-                await self.send_single_congratulation(
-                    sender_name=user2["first_name"],
-                    congrat=congrat,
-                    user1_id=user1_id,
-                    user2_id=user2_id
-                )
-                total_sent += 1
-                await asyncio.sleep(0.1)  # Небольшая пауза между отправками
-
-        logger.info(f"✅ ТЕСТ ЗАВЕРШЕН. Отправлено {total_sent} поздравлений")
+        logger.info(f"✅ ТЕСТ ЗАВЕРШЕН. Отправлено {total_sent} поздравлений для {total_pairs} пар")
 
     async def get_schedule_info(self) -> Dict:
         """
         Возвращает информацию о запланированных задачах
         """
+        pending = len(self._heap) + (self._queue.qsize() if self._queue else 0)
         return {
-            "total_tasks": len(self.scheduled_tasks),
-            "active_tasks": sum(1 for t in self.scheduled_tasks if not t.done()),
+            "planned_tasks": self.total_planned,
+            "total_tasks": self.total_scheduled,
+            "active_tasks": pending + self._in_progress,
+            "sent_tasks": self.total_sent,
+            "avg_latency_ms": round(
+                self._latency_total / self._latency_count * 1000
+                if self._latency_count else 0.0, 1
+            ),
+            "projected_peak_per_minute": (
+                self.last_plan.peak_per_minute * 2 if self.last_plan else 0
+            ),
+            "send_capacity_per_minute": round(self.send_rate * 60),
+            "planning": self.planning is not None,
+            "planning_pairs": self.planning.pairs if self.planning else 0,
+            "planning_congratulations": self.planning.congratulations if self.planning else 0,
+            "planning_stored": self.planning.stored if self.planning else 0,
+            "planning_elapsed": round(self.planning.elapsed) if self.planning else 0,
+            "is_leader": self.is_leader,
             "is_test_mode": self.is_test_mode,
             "current_year": datetime.now().year,
         }
 
-    async def cleanup(self) -> None:
+    async def _stop_tasks(self) -> None:
         """
-        Очистка ресурсов и отмена всех задач
+        Остановка планирования, диспетчера и воркеров. Загруженные в очередь
+        доставки остаются в outbox и будут отправлены после следующего start()
         """
-        # Отменяем все запланированные задачи
-        for task in self.scheduled_tasks:
+        tasks = [
+            t for t in [
+                self._planning_task, self._dispatcher_task, self._outbox_task,
+                self._lease_task, *self._workers
+            ] if t
+        ]
+        for task in tasks:
             if not task.done():
                 task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+        self._planning_task = None
+        self._dispatcher_task = None
+        self._outbox_task = None
+        self._lease_task = None
+        self._workers = []
+        self._heap.clear()
+        self._claims.clear()
+        # Следующий запуск начнется с полного плана: отметка могла устареть
+        self._watermark = None
+
+    async def cleanup(self) -> None:
+        """
+        Очистка ресурсов и отмена всех задач
+        """
+        # Уступаем лидерство, останавливаем диспетчер и воркеров
+        if self._leadership_task:
+            self._leadership_task.cancel()
+            await asyncio.gather(self._leadership_task, return_exceptions=True)
+            self._leadership_task = None
+        await self._stop_tasks()
 
         # Закрываем сессию бота
         if self.bot:
@@ -343,8 +977,20 @@ async def init_scheduler(bot: Bot = None) -> NewYearScheduler:
     """
     if bot:
         scheduler.bot = bot
-
-    # Запускаем планирование
-    await scheduler.schedule_all_congratulations()
+    cfg = load_config()
+    scheduler.coalesce_window = cfg.scheduler.coalesce_window
+    scheduler.send_rate = cfg.limits.global_rate * cfg.scheduler.send_share
+    scheduler.quiet_hours = cfg.scheduler.quiet_hours
+    scheduler.planning_interval = cfg.scheduler.planning_interval
+    scheduler.claim_lease = cfg.scheduler.claim_lease
+    scheduler.external_workers = cfg.scheduler.external_workers
+    scheduler.leader_lock = LeaderLock(
+        cfg.scheduler.leader_lock_key, cfg.scheduler.leader_check_interval
+    )
+
+    # Диспетчер outbox и планирование запускаются в фоне, когда реплика станет
+    # лидером: бот отвечает пользователям сразу, новые поздравления добавляются
+    # в план по мере создания
+    scheduler.start_leadership()
 
     return scheduler
\ No newline at end of file
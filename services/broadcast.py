@@ -0,0 +1,254 @@
+"""
+Рассылка сообщения всем пользователям бота.
+
+Получатели читаются пачками по первичному ключу (keyset-пагинация), сообщения
+внутри пачки отправляются параллельно, темп задает общий лимитер сессии бота.
+После каждой пачки прогресс сохраняется в таблицу broadcasts, поэтому
+после перезапуска рассылка продолжается с места остановки.
+
+Рассылку ведет один процесс бота, пока продлевает ее аренду (lease_until):
+по таймеру, независимо от того, сколько идет пачка. Если процесс пропал,
+аренда истекает и рассылку подхватывает другой процесс.
+"""
+import asyncio
+import logging
+import time
+from datetime import timedelta
+from typing import Dict, Optional
+
+from aiogram import Bot
+
+from database.models import BroadcastStatus
+from database.repository import (checkpoint_broadcast, claim_broadcast,
+                                 create_broadcast, extend_broadcast_lease,
+                                 get_broadcast, get_chat_ids_after,
+                                 get_last_broadcast, get_running_broadcasts)
+from services.dead_chats import dead_chats, is_dead_chat_error
+
+logger = logging.getLogger(__name__)
+
+
+class BroadcastProgress:
+    """Прогресс рассылки в текущем процессе: скорость и оставшееся время"""
+
+    def __init__(self, broadcast_id: int, total: int, processed: int):
+        self.broadcast_id = broadcast_id
+        self.total = total
+        self.processed_at_start = processed
+        self.sent = 0
+        self.failed = 0
+        self.started = time.monotonic()
+
+    @property
+    def processed(self) -> int:
+        return self.processed_at_start + self.sent + self.failed
+
+    @property
+    def rate(self) -> float:
+        elapsed = time.monotonic() - self.started
+        return (self.sent + self.failed) / elapsed if elapsed > 0 else 0.0
+
+    @property
+    def eta_seconds(self) -> Optional[float]:
+        rate = self.rate
+        if not rate:
+            return None
+        return max(0, self.total - self.processed) / rate
+
+
+class BroadcastService:
+    """Запуск, продолжение и отслеживание рассылок"""
+
+    def __init__(
+        self,
+        bot: Bot = None,
+        batch_size: int = 500,
+        concurrency: int = 50,
+        lease: float = 120.0,
+    ):
+        self.bot = bot
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        # Аренда рассылки, сек: продлевается после каждой пачки
+        self.lease = timedelta(seconds=lease)
+        self._resume_task: Optional[asyncio.Task] = None
+        self._tasks: Dict[int, asyncio.Task] = {}
+        self._progress: Dict[int, BroadcastProgress] = {}
+        self._cancelled: set[int] = set()
+
+    @property
+    def is_running(self) -> bool:
+        return any(not task.done() for task in self._tasks.values())
+
+    async def start(self, text: str) -> int:
+        """Создать рассылку и запустить ее в фоне, возвращает id рассылки"""
+        broadcast = await create_broadcast(text, self.lease)
+        logger.info(f"📣 Рассылка #{broadcast.id} на {broadcast.total} получателей")
+        self._spawn(broadcast.id)
+        return broadcast.id
+
+    def start_resuming(self) -> None:
+        """Фоновый подхват рассылок, брошенных перезапущенными или упавшими процессами"""
+        if self._resume_task is None or self._resume_task.done():
+            self._resume_task = asyncio.create_task(self._resume_loop())
+
+    async def _resume_loop(self) -> None:
+        while True:
+            try:
+                await self.resume_unfinished()
+            except Exception as e:
+                logger.error(f"Ошибка при продолжении рассылок: {e}")
+            await asyncio.sleep(self.lease.total_seconds() / 2)
+
+    async def resume_unfinished(self) -> None:
+        """Продолжить рассылки, прерванные перезапуском, если их никто не ведет"""
+        for broadcast in await get_running_broadcasts():
+            task = self._tasks.get(broadcast.id)
+            if (task is None or task.done()) and await claim_broadcast(broadcast.id, self.lease):
+                logger.info(
+                    f"♻️ Продолжаем рассылку #{broadcast.id} "
+                    f"после пользователя {broadcast.last_user_id}"
+                )
+                self._spawn(broadcast.id)
+
+    async def cancel(self, broadcast_id: int) -> bool:
+        task = self._tasks.get(broadcast_id)
+        if not task or task.done():
+            return False
+        # Остановка после текущей пачки, чтобы контрольная точка осталась точной
+        self._cancelled.add(broadcast_id)
+        return True
+
+    async def _keep_lease(self, broadcast_id: int) -> None:
+        """
+        Продление аренды каждые lease/3 секунд: пачка при темпе одного чата
+        и паузах после 429 может идти дольше аренды
+        """
+        while True:
+            await asyncio.sleep(self.lease.total_seconds() / 3)
+            try:
+                await extend_broadcast_lease(broadcast_id, self.lease)
+            except Exception as e:
+                logger.error(f"Не удалось продлить аренду рассылки #{broadcast_id}: {e}")
+
+    def _spawn(self, broadcast_id: int) -> None:
+        self._tasks[broadcast_id] = asyncio.create_task(self._run(broadcast_id))
+
+    async def _send(self, semaphore: asyncio.Semaphore, chat_id: int, text: str) -> bool:
+        if dead_chats.is_dead(chat_id):
+            return False
+        async with semaphore:
+            try:
+                await self.bot.send_message(chat_id, text)
+                return True
+            except Exception as e:
+                if is_dead_chat_error(e):
+                    dead_chats.add(chat_id)
+                else:
+                    logger.warning(f"Рассылка: не удалось отправить {chat_id}: {e}")
+                return False
+
+    async def _run(self, broadcast_id: int) -> None:
+        broadcast = await get_broadcast(broadcast_id)
+        if broadcast is None or broadcast.status != BroadcastStatus.RUNNING:
+            return
+
+        progress = BroadcastProgress(
+            broadcast_id,
+            total=broadcast.total,
+            processed=broadcast.sent_count + broadcast.failed_count,
+        )
+        self._progress[broadcast_id] = progress
+        semaphore = asyncio.Semaphore(self.concurrency)
+        last_user_id = broadcast.last_user_id
+        lease_task = asyncio.create_task(self._keep_lease(broadcast_id))
+
+        try:
+            while True:
+                if broadcast_id in self._cancelled:
+                    await checkpoint_broadcast(
+                        broadcast_id, last_user_id, 0, 0, BroadcastStatus.CANCELLED
+                    )
+                    logger.info(f"⏹ Рассылка #{broadcast_id} остановлена")
+                    return
+
+                batch = await get_chat_ids_after(last_user_id, self.batch_size)
+                if not batch:
+                    await checkpoint_broadcast(
+                        broadcast_id, last_user_id, 0, 0, BroadcastStatus.DONE
+                    )
+                    logger.info(
+                        f"✅ Рассылка #{broadcast_id} завершена: "
+                        f"отправлено {progress.sent}, ошибок {progress.failed}"
+                    )
+                    return
+
+                results = await asyncio.gather(*(
+                    self._send(semaphore, chat_id, broadcast.text) for _, chat_id in batch
+                ))
+                sent = sum(results)
+                failed = len(results) - sent
+                progress.sent += sent
+                progress.failed += failed
+                last_user_id = batch[-1][0]
+
+                await checkpoint_broadcast(
+                    broadcast_id, last_user_id, sent, failed, lease=self.lease
+                )
+                logger.info(
+                    f"📣 Рассылка #{broadcast_id}: {progress.processed}/{progress.total}, "
+                    f"{progress.rate:.1f} сообщ/сек"
+                )
+        except asyncio.CancelledError:
+            # Процесс завершается: статус остается running, продолжим после перезапуска
+            raise
+        except Exception as e:
+            logger.error(f"Рассылка #{broadcast_id} прервана ошибкой: {e}")
+            try:
+                await checkpoint_broadcast(
+                    broadcast_id, last_user_id, 0, 0, BroadcastStatus.FAILED
+                )
+            except Exception as checkpoint_error:
+                # База недоступна: статус остается running, после истечения
+                # аренды рассылку продолжит процесс бота
+                logger.error(
+                    f"Не удалось отметить рассылку #{broadcast_id} как failed: "
+                    f"{checkpoint_error}"
+                )
+        finally:
+            lease_task.cancel()
+            self._cancelled.discard(broadcast_id)
+
+    async def get_status(self, broadcast_id: Optional[int] = None) -> Optional[Dict]:
+        """Состояние рассылки (по умолчанию - последней)"""
+        if broadcast_id is None:
+            broadcast = await get_last_broadcast()
+        else:
+            broadcast = await get_broadcast(broadcast_id)
+        if broadcast is None:
+            return None
+
+        progress = self._progress.get(broadcast.id)
+        return {
+            "id": broadcast.id,
+            "status": broadcast.status,
+            "total": broadcast.total,
+            "sent": broadcast.sent_count,
+            "failed": broadcast.failed_count,
+            "rate": progress.rate if progress else 0.0,
+            "eta_seconds": (
+                progress.eta_seconds
+                if progress and broadcast.status == BroadcastStatus.RUNNING
+                else None
+            ),
+        }
+
+    async def cleanup(self) -> None:
+        tasks = [t for t in [self._resume_task, *self._tasks.values()] if t and not t.done()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+# Глобальный экземпляр сервиса рассылок
+broadcaster = BroadcastService()
@@ -0,0 +1,123 @@
+"""
+Учет чатов, в которые бот больше не может писать.
+
+Ошибка отправки классифицируется по типу исключения aiogram. Мертвые chat_id
+копятся в буфере и записываются в базу одним запросом: когда набралось
+flush_size штук или прошло flush_interval секунд. До записи они уже
+известны процессу, поэтому рассылка и планировщик пропускают их сразу.
+
+Память процесса - только короткий кэш на ttl секунд: дальше источник истины
+колонка users.is_blocked, которую сбрасывает /start в боте. Иначе воркер,
+однажды увидевший мертвый чат, пропускал бы вернувшегося пользователя
+до своего перезапуска.
+"""
+import asyncio
+import logging
+import time
+from typing import Dict, List, Optional
+
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError
+
+from database.repository import mark_chats_blocked
+
+logger = logging.getLogger(__name__)
+
+
+def is_dead_chat_error(error: Exception) -> bool:
+    """
+    Ошибка означает, что писать в этот чат бессмысленно.
+    TelegramNotFound (HTTP 404) сюда не входит: это ошибка запроса, а не чата
+    """
+    if isinstance(error, TelegramForbiddenError):
+        return True
+    return isinstance(error, TelegramBadRequest) and "chat not found" in error.message.lower()
+
+
+class DeadChatBuffer:
+    """Буфер мертвых чатов с пакетной записью в базу"""
+
+    def __init__(self, flush_size: int = 100, flush_interval: float = 5.0,
+                 ttl: float = 60.0):
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.ttl = ttl
+        # chat_id -> момент (monotonic), до которого чат считается мертвым
+        self._known: Dict[int, float] = {}
+        self._pending: List[int] = []
+        self._flush_task: Optional[asyncio.Task] = None
+        # Внеочередные записи при заполнении буфера; ссылка нужна, чтобы задачу не собрал GC
+        self._flush_now: Optional[asyncio.Task] = None
+        self._lock: Optional[asyncio.Lock] = None
+        self.total_blocked = 0
+
+    def is_dead(self, chat_id: int) -> bool:
+        expires = self._known.get(chat_id)
+        if expires is None:
+            return False
+        if expires <= time.monotonic():
+            del self._known[chat_id]
+            return False
+        return True
+
+    def add(self, chat_id: int) -> None:
+        if self.is_dead(chat_id):
+            return
+        self._known[chat_id] = time.monotonic() + self.ttl
+        if chat_id not in self._pending:
+            self._pending.append(chat_id)
+        self._ensure_started()
+        if len(self._pending) >= self.flush_size and (
+            self._flush_now is None or self._flush_now.done()
+        ):
+            self._flush_now = asyncio.create_task(self.flush())
+
+    def forget(self, chat_id: int) -> None:
+        """Пользователь вернулся (/start) - снова можно писать"""
+        self._known.pop(chat_id, None)
+        if chat_id in self._pending:
+            self._pending.remove(chat_id)
+
+    def _ensure_started(self) -> None:
+        if self._flush_task is None or self._flush_task.done():
+            self._lock = asyncio.Lock()
+            self._flush_task = asyncio.create_task(self._flush_loop())
+
+    async def _flush_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+            self._expire()
+
+    def _expire(self) -> None:
+        now = time.monotonic()
+        for chat_id in [c for c, expires in self._known.items() if expires <= now]:
+            del self._known[chat_id]
+
+    async def flush(self) -> None:
+        if not self._pending:
+            return
+        async with self._lock:
+            chat_ids, self._pending = self._pending, []
+            if not chat_ids:
+                return
+            try:
+                blocked = await mark_chats_blocked(chat_ids)
+                self.total_blocked += blocked
+                logger.info(f"🚫 Отмечено заблокировавших бота: {blocked}")
+            except Exception as e:
+                # Вернем в буфер, запишем при следующей попытке
+                self._pending.extend(chat_ids)
+                logger.error(f"Ошибка записи заблокированных чатов: {e}")
+
+    async def cleanup(self) -> None:
+        if self._flush_task:
+            self._flush_task.cancel()
+            await asyncio.gather(self._flush_task, return_exceptions=True)
+        if self._flush_now:
+            await asyncio.gather(self._flush_now, return_exceptions=True)
+        if self._lock is not None:
+            await self.flush()
+
+
+# Глобальный буфер мертвых чатов
+dead_chats = DeadChatBuffer()
@@ -0,0 +1,44 @@
+"""
+Хранилище состояний FSM (многошаговые диалоги создания ивента и поздравления).
+
+В Redis состояние переживает перезапуск бота и доступно всем его процессам.
+Данные состояния сериализуются компактным JSON: без пробелов и без
+\\u-экранирования, кириллица в тексте поздравления занимает вдвое меньше.
+"""
+import json
+from functools import partial
+
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder
+from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.fsm.storage.redis import RedisStorage
+from redis.asyncio import Redis
+
+from config.config import RedisConfig
+
+compact_json_dumps = partial(json.dumps, ensure_ascii=False, separators=(",", ":"))
+
+
+def create_fsm_storage(config: RedisConfig) -> BaseStorage:
+    """
+    Хранилище по config.fsm_storage: memory - в памяти процесса (один процесс),
+    redis - общий Redis, fakeredis - Redis в памяти процесса для тестов
+    """
+    if config.fsm_storage == "memory":
+        return MemoryStorage()
+    if config.fsm_storage == "redis":
+        redis = Redis(host=config.host, port=config.port, db=config.db)
+    elif config.fsm_storage == "fakeredis":
+        from fakeredis import FakeAsyncRedis
+
+        redis = FakeAsyncRedis()
+    else:
+        raise ValueError(f"Неизвестное хранилище FSM: {config.fsm_storage}")
+
+    return RedisStorage(
+        redis,
+        key_builder=DefaultKeyBuilder(with_bot_id=True),
+        # Брошенные на середине диалоги не копятся в Redis бесконечно
+        state_ttl=config.fsm_ttl or None,
+        data_ttl=config.fsm_ttl or None,
+        json_dumps=compact_json_dumps,
+    )
@@ -0,0 +1,168 @@
+"""
+Планирование времени отправки поздравлений с учетом пропускной способности.
+
+Окно кампании делится на минутные слоты, слоты в тихие часы пропускаются.
+Сообщения раскладываются по слотам равномерно, так что ни в одной минуте
+их не больше, чем бот может отправить. Если окна не хватает, план
+продолжается за его концом с полной загрузкой каждой минуты.
+Минуты, уже занятые прошлыми планами (load), заполняются только до потолка.
+
+Все вычисления векторные (NumPy): план на миллион поздравлений строится
+за доли секунды и не блокирует event loop. Результат - массив epoch-секунд.
+"""
+import math
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+SLOT_SECONDS = 60
+
+
+@dataclass
+class DeliveryPlan:
+    """Готовый план: время отправки каждого элемента и прогноз нагрузки"""
+
+    # Время отправки каждого элемента, epoch-секунды (float64), по возрастанию
+    send_times: np.ndarray = field(default_factory=lambda: np.empty(0))
+    capacity_per_minute: int = 0  # Сколько элементов помещается в минуту
+    peak_per_minute: int = 0  # Максимум элементов в одной минуте плана
+    slots_used: int = 0
+    overflow: bool = False  # План вышел за конец окна
+
+    @property
+    def peak_messages_per_second(self) -> float:
+        return self.peak_per_minute / 60
+
+    @property
+    def end(self) -> Optional[datetime]:
+        """Время последней отправки"""
+        if not len(self.send_times):
+            return None
+        return datetime.fromtimestamp(float(self.send_times[-1]))
+
+
+def _quiet_mask(
+    minute_of_day: np.ndarray, quiet_hours: Optional[Tuple[int, int]]
+) -> np.ndarray:
+    """Маска слотов в тихие часы [start, end), допускается переход через полночь"""
+    if quiet_hours is None or quiet_hours[0] == quiet_hours[1]:
+        return np.zeros(len(minute_of_day), dtype=bool)
+    start, end = quiet_hours
+    hour = minute_of_day // 60
+    if start < end:
+        return (hour >= start) & (hour < end)
+    return (hour >= start) | (hour < end)
+
+
+def _check_quiet_hours(quiet_hours: Optional[Tuple[int, int]]) -> None:
+    """Тихие часы не должны занимать все сутки: иначе план построить нельзя"""
+    if quiet_hours is None:
+        return
+    if len(quiet_hours) != 2 or not all(0 <= hour <= 23 for hour in quiet_hours):
+        raise ValueError(f"Тихие часы задаются двумя числами от 0 до 23: {quiet_hours}")
+    if _quiet_mask(np.arange(24 * 60), quiet_hours).all():
+        raise ValueError(f"Тихие часы {quiet_hours} занимают все сутки")
+
+
+def _slots(
+    start: datetime, minutes: int, quiet_hours: Optional[Tuple[int, int]]
+) -> np.ndarray:
+    """
+    Начала рабочих минутных слотов (epoch-секунды) в первых minutes минутах
+    от start. Слоты совпадают с календарными минутами, начинаем с ближайшей целой
+    """
+    first = math.ceil(start.timestamp() / SLOT_SECONDS) * SLOT_SECONDS
+    offsets = np.arange(max(0, minutes), dtype=np.int64)
+    # Час слота считаем по местному времени, как и остальной планировщик
+    first_local = datetime.fromtimestamp(first)
+    first_minute_of_day = first_local.hour * 60 + first_local.minute
+    minute_of_day = (first_minute_of_day + offsets) % (24 * 60)
+    slots = first + offsets * SLOT_SECONDS
+    return slots[~_quiet_mask(minute_of_day, quiet_hours)].astype(np.float64)
+
+
+def _free_capacity(
+    slots: np.ndarray, capacity: int, load: Optional[Dict[int, int]]
+) -> np.ndarray:
+    """Сколько элементов еще помещается в каждый слот с учетом уже запланированных"""
+    free = np.full(len(slots), capacity, dtype=np.int64)
+    if load:
+        free -= np.fromiter(
+            (load.get(int(slot), 0) for slot in slots), dtype=np.int64, count=len(slots)
+        )
+    return np.clip(free, 0, None)
+
+
+def plan_send_times(
+    count: int,
+    start: datetime,
+    end: datetime,
+    messages_per_minute: float,
+    messages_per_item: int = 2,
+    quiet_hours: Optional[Tuple[int, int]] = None,
+    rng: Optional[np.random.Generator] = None,
+    load: Optional[Dict[int, int]] = None,
+) -> DeliveryPlan:
+    """
+    Разложить count элементов (поздравлений) по окну [start, end).
+
+    messages_per_minute - потолок отправок в минуту, messages_per_item - сколько
+    сообщений дает один элемент (поздравление уходит обоим партнерам).
+    Внутри минуты время выбирается случайно, поэтому поминутная нагрузка
+    не превышает потолок. load - сколько элементов уже запланировано
+    в слот (ключ - начало минуты в epoch-секундах).
+    """
+    _check_quiet_hours(quiet_hours)
+    rng = rng or np.random.default_rng()
+    capacity = max(1, int(messages_per_minute // messages_per_item))
+    plan = DeliveryPlan(capacity_per_minute=capacity)
+    if count <= 0:
+        return plan
+
+    window_minutes = math.ceil((end.timestamp() - start.timestamp()) / SLOT_SECONDS)
+    slots = _slots(start, window_minutes, quiet_hours)
+    slots = slots[slots < end.timestamp()]
+    window_slots = len(slots)
+
+    free = _free_capacity(slots, capacity, load)
+
+    if free.sum() < count:
+        # Окна не хватает: дозаполняем минуты после его конца до потолка
+        plan.overflow = True
+        needed = count - int(free.sum())
+        after = max(end, start)
+        minutes = math.ceil(needed / capacity)
+        extra_free = np.empty(0, dtype=np.int64)
+        while extra_free.sum() < needed:
+            # Запас на тихие часы и занятые минуты: берем с избытком и расширяем при нехватке
+            minutes = minutes * 2 + 24 * 60
+            extra = _slots(after, minutes, quiet_hours)
+            extra_free = _free_capacity(extra, capacity, load)
+        used = int(np.searchsorted(np.cumsum(extra_free), needed)) + 1
+        slots = np.concatenate([slots, extra[:used]])
+        per_slot = np.concatenate([free, extra_free[:used]])
+        per_slot[-1] -= per_slot.sum() - count
+    else:
+        # Равномерно по свободным местам: при пустом окне элемент i попадает
+        # в слот floor(i * slots / count)
+        positions = np.arange(count, dtype=np.int64) * int(free.sum()) // count
+        slot_index = np.searchsorted(np.cumsum(free), positions, side="right")
+        per_slot = np.bincount(slot_index, minlength=len(slots))
+
+    # Внутри минуты время случайное, но в последней минуте окна - не позже end
+    width = np.full(len(slots), SLOT_SECONDS - 1.0)
+    width[:window_slots] = np.minimum(width[:window_slots], end.timestamp() - slots[:window_slots])
+    send_times = np.repeat(slots, per_slot) + rng.uniform(0, 1, count) * np.repeat(width, per_slot)
+    send_times.sort()
+
+    plan.send_times = send_times
+    if load:
+        # Пик с учетом уже запланированного в те же минуты
+        per_slot = per_slot + np.fromiter(
+            (load.get(int(slot), 0) for slot in slots), dtype=np.int64, count=len(slots)
+        )
+    plan.peak_per_minute = int(per_slot.max())
+    plan.slots_used = int(np.count_nonzero(per_slot))
+    return plan
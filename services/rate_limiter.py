@@ -0,0 +1,173 @@
+import asyncio
+import time
+from typing import Dict, Optional
+
+
+class TokenBucket:
+    """
+    Token bucket с резервированием: запрос сразу получает свое место в очереди
+    и ждет ровно столько, сколько нужно для накопления токена
+    """
+
+    def __init__(self, rate: float, capacity: float = 1.0):
+        self.rate = rate  # токенов в секунду
+        self.capacity = capacity  # максимальный "всплеск"
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def reserve(self) -> float:
+        """Забрать токен и вернуть, сколько секунд нужно подождать"""
+        self._refill()
+        self.tokens -= 1
+        if self.tokens >= 0:
+            return 0.0
+        return -self.tokens / self.rate
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def pause(self, seconds: float) -> None:
+        """Запретить отправку на seconds секунд (с учетом уже занятых мест)"""
+        self._refill()
+        # +1: следующий reserve() заберет токен и будет ждать ровно seconds
+        self.tokens = min(self.tokens, 0.0) + 1 - seconds * self.rate
+
+    def set_rate(self, rate: float, capacity: Optional[float] = None) -> None:
+        """Изменить скорость пополнения, сохранив время ожидания уже занятых мест"""
+        self._refill()
+        if self.tokens < 0:
+            self.tokens = self.tokens / self.rate * rate
+        self.rate = rate
+        if capacity is not None:
+            self.capacity = capacity
+        self.tokens = min(self.tokens, self.capacity)
+
+    def is_idle(self) -> bool:
+        """Бакет полон - его можно удалить без потери информации"""
+        now = time.monotonic()
+        return self.tokens + (now - self.updated) * self.rate >= self.capacity
+
+
+class RateLimiter:
+    """
+    Общий лимитер исходящих сообщений: глобальный бюджет бота
+    и отдельный бюджет на каждый чат.
+
+    Глобальная скорость подстраивается под ответы Telegram: каждый 429
+    снижает ее в decrease_factor раз, а серия успешных отправок без 429
+    постепенно возвращает ее к max_rate.
+    """
+
+    def __init__(
+        self,
+        global_rate: float = 30.0,
+        per_chat_rate: float = 1.0,
+        per_chat_burst: float = 3.0,
+        max_chat_buckets: int = 10000,
+        min_rate: float = 5.0,
+        decrease_factor: float = 0.7,
+        increase_step: float = 1.0,
+        increase_every: int = 100,
+    ):
+        self.global_bucket = TokenBucket(global_rate, capacity=global_rate)
+        self.per_chat_rate = per_chat_rate
+        # Несколько сообщений подряд в один чат (ответ обработчика из двух-трех
+        # сообщений) уходят сразу, дальше - per_chat_rate в секунду
+        self.per_chat_burst = per_chat_burst
+        self.max_chat_buckets = max_chat_buckets
+        self._chat_buckets: Dict[int | str, TokenBucket] = {}
+
+        # Параметры адаптации глобальной скорости
+        self.max_rate = global_rate
+        self.min_rate = min(min_rate, global_rate)
+        self.decrease_factor = decrease_factor
+        self.increase_step = increase_step
+        self.increase_every = increase_every
+        self._successes = 0
+
+        # Счетчики для админских команд
+        self.sent_count = 0
+        self.flood_count = 0
+
+    def _chat_bucket(self, chat_id: int | str) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self._chat_buckets) >= self.max_chat_buckets:
+                self._prune()
+            bucket = TokenBucket(self.per_chat_rate, capacity=self.per_chat_burst)
+            self._chat_buckets[chat_id] = bucket
+        return bucket
+
+    def _prune(self) -> None:
+        """Удаляем бакеты чатов, в которые давно ничего не отправляли"""
+        for chat_id in [c for c, b in self._chat_buckets.items() if b.is_idle()]:
+            del self._chat_buckets[chat_id]
+
+    async def acquire(self, chat_id: Optional[int | str] = None) -> None:
+        """Дождаться разрешения на отправку сообщения в чат"""
+        if chat_id is not None:
+            delay = self._chat_bucket(chat_id).reserve()
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+        delay = self.global_bucket.reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    @property
+    def current_rate(self) -> float:
+        return self.global_bucket.rate
+
+    def _set_global_rate(self, rate: float) -> None:
+        # Всплеск глобального бакета - не больше секунды отправок на текущей скорости
+        self.global_bucket.set_rate(rate, capacity=rate)
+
+    def on_success(self) -> None:
+        """Успешная отправка: после серии без 429 поднимаем скорость"""
+        self.sent_count += 1
+        self._successes += 1
+        if self._successes >= self.increase_every and self.current_rate < self.max_rate:
+            self._successes = 0
+            self._set_global_rate(min(self.max_rate, self.current_rate + self.increase_step))
+
+    def on_flood(self, chat_id: Optional[int | str], retry_after: float) -> None:
+        """
+        Telegram ответил 429: приостанавливаем чат (или весь бот, если чата нет)
+        и снижаем глобальную скорость
+        """
+        self.flood_count += 1
+        self._successes = 0
+        if chat_id is not None:
+            self._chat_bucket(chat_id).pause(retry_after)
+        else:
+            self.global_bucket.pause(retry_after)
+        self._set_global_rate(max(self.min_rate, self.current_rate * self.decrease_factor))
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "current_rate": round(self.current_rate, 2),
+            "max_rate": self.max_rate,
+            "sent": self.sent_count,
+            "floods": self.flood_count,
+            "chat_buckets": len(self._chat_buckets),
+        }
+
+
+_rate_limiter: Optional[RateLimiter] = None
+
+
+def get_rate_limiter() -> RateLimiter:
+    """Общий для процесса лимитер, настраивается из конфигурации"""
+    global _rate_limiter
+    if _rate_limiter is None:
+        from config.config import load_config
+
+        cfg = load_config()
+        _rate_limiter = RateLimiter(
+            global_rate=cfg.limits.global_rate,
+            per_chat_rate=cfg.limits.per_chat_rate,
+            per_chat_burst=cfg.limits.per_chat_burst,
+        )
+    return _rate_limiter
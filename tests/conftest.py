@@ -0,0 +1,15 @@
+import os
+import sys
+from pathlib import Path
+
+# Модули бота читают конфигурацию при импорте; к базе тесты не подключаются
+for name, value in {
+    "BOT_TOKEN": "123456:test",
+    "DB_HOST": "localhost",
+    "DB_PORT": "5432",
+    "LOG_LEVEL": "INFO",
+    "LOG_FORMAT": "%(message)s",
+}.items():
+    os.environ.setdefault(name, value)
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
@@ -0,0 +1,34 @@
+from datetime import datetime
+
+import pytest
+
+from newyear_sheduler import NewYearScheduler
+
+
+@pytest.fixture
+def scheduler():
+    return NewYearScheduler()
+
+
+def test_window_during_campaign(scheduler):
+    now = datetime(2026, 1, 5, 12, 0)
+    assert scheduler._campaign_window(now=now) == (now, datetime(2026, 1, 13, 23, 59, 59))
+
+
+def test_window_before_campaign(scheduler):
+    assert scheduler._campaign_window(now=datetime(2025, 12, 31, 23, 0)) is None
+
+
+@pytest.mark.parametrize("now", [
+    datetime(2026, 1, 14, 0, 0),
+    datetime(2026, 10, 18, 15, 30),
+    datetime(2027, 1, 5, 12, 0),
+])
+def test_no_window_after_campaign(scheduler, now):
+    # Поздравления, написанные после кампании, не отправляются сразу
+    assert scheduler._campaign_window(now=now) is None
+
+
+def test_test_mode_ignores_dates(scheduler):
+    start, end = scheduler._campaign_window(test_mode=True, now=datetime(2026, 10, 18))
+    assert start == datetime(2026, 10, 18, 0, 1) and (end - start).days == 2
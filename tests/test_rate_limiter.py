@@ -0,0 +1,15 @@
+from services.rate_limiter import RateLimiter, TokenBucket
+
+
+def test_token_bucket_waits_after_burst():
+    bucket = TokenBucket(rate=1.0, capacity=3)
+    assert [bucket.reserve() for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert 0.9 < bucket.reserve() <= 1.0
+
+
+def test_chat_burst_is_sent_without_delay():
+    # /start отвечает двумя сообщениями подряд: второе не ждет секунду
+    limiter = RateLimiter(global_rate=30.0, per_chat_rate=1.0, per_chat_burst=3)
+    bucket = limiter._chat_bucket(42)
+    assert [bucket.reserve() for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert bucket.reserve() > 0
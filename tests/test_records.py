@@ -0,0 +1,27 @@
+from database.records import CongratRecord, PairRecord
+
+
+def test_pair_record_json_roundtrip():
+    pair = PairRecord(1, "a", 2, "b", (CongratRecord(10, "a", "С Новым годом!"),))
+    assert PairRecord.from_json(pair.to_json()) == pair
+
+
+def test_pair_record_from_legacy_json():
+    # Задачи send_congratulations_to_pair, поставленные до перехода на PairRecord
+    pair = PairRecord.from_json({
+        "user1": {
+            "telegram_id": 1,
+            "first_name": "a",
+            "congratulations": [{"message": "m1", "photo_file_id": None}],
+        },
+        "user2": {
+            "telegram_id": 2,
+            "first_name": "b",
+            "congratulations": [{"message": "m2", "photo_file_id": "photo"}],
+        },
+    })
+    assert pair.recipients == (1, 2)
+    assert [(c.sender_name, c.message, c.photo_file_id) for c in pair.congratulations] == [
+        ("a", "m1", None),
+        ("b", "m2", "photo"),
+    ]